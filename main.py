@@ -7,27 +7,98 @@ operations inside VMWare vCenter.
 https://github.com/mdechiaro/vctools/
 """
 
+import functools
+import json
 import logging
 from getpass import getuser
 import os
 import ssl
 import sys
+import threading
+import time
 import yaml
+try:
+    from yaml import CSafeDumper as _YDumper, CSafeLoader as _YLoader
+except ImportError:
+    from yaml import SafeDumper as _YDumper, SafeLoader as _YLoader
+# ryaml follows YAML 1.2, so values like yes, no or 010 load differently than
+# with PyYAML.  Only use it when asked to with VCTOOLS_RYAML=1.
+ryaml = None
+if os.environ.get('VCTOOLS_RYAML') == '1':
+    try:
+        import ryaml
+    except ImportError:
+        pass
 #
-from pyVmomi import vim # pylint: disable=no-name-in-module
-from vctools.argparser import ArgParser
-from vctools.auth import Auth
-from vctools.vmconfig_helper import VMConfigHelper
-from vctools.clusterconfig import ClusterConfig
-from vctools.prompts import Prompts
-from vctools.query import Query
-from vctools.cfgchecker import CfgCheck
+from vctools.argparser import ArgParser, VersionAction
 from vctools import Logger
 
+def load_yaml(stream):
+    """
+    Loads a yaml document from a binary stream with the PyYAML safe loader,
+    or with the ryaml parser when VCTOOLS_RYAML=1 and it is installed.
+
+    Args:
+        stream (obj): File object opened in binary mode
+    """
+    # a single bytes object lets libyaml scan contiguous memory instead of
+    # calling back into python for each chunk it reads.
+    data = stream.read()
+    if ryaml:
+        return ryaml.loads(data.decode('utf-8'))
+
+    return yaml.load(data, Loader=_YLoader)
+
+def load_rc(path):
+    """
+    Loads a dotrc file, reusing its parsed copy in ~/.cache/vctools while the
+    file's mtime and size are unchanged, since reading json is much faster
+    than parsing yaml.
+
+    Args:
+        path (str): Path to the dotrc file
+    """
+    stat = os.stat(path)
+    # the parser is part of the key, since ryaml may load the file differently
+    key = [stat.st_mtime_ns, stat.st_size, bool(ryaml)]
+    cache_file = os.path.join(
+        os.path.expanduser('~/.cache/vctools'),
+        os.path.abspath(path).replace(os.sep, '%') + '.json'
+    )
+    try:
+        with open(cache_file) as cache_stream:
+            cache = json.load(cache_stream)
+        if cache['stat'] == key:
+            return cache['dotrc']
+    except (IOError, ValueError, KeyError):
+        pass
+
+    with open(path, 'rb') as rc_stream:
+        dotrc = load_yaml(rc_stream)
+
+    # json turns int keys into strings and has no dates, only cache a dotrc
+    # that comes back unchanged.  A dotrc may hold a passwd, so the copy is
+    # only readable by the user, like the saved session.
+    try:
+        if json.loads(json.dumps(dotrc)) == dotrc:
+            os.makedirs(os.path.dirname(cache_file), mode=0o700, exist_ok=True)
+            fdesc = os.open(cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # an existing copy keeps its old mode otherwise
+            os.fchmod(fdesc, 0o600)
+            with os.fdopen(fdesc, 'w') as cache_stream:
+                json.dump({'stat' : key, 'dotrc' : dotrc}, cache_stream)
+    except (IOError, TypeError, ValueError):
+        pass
+
+    return dotrc
+
 class VCTools(Logger):
     """
     Main VCTools class.
     """
+    __slots__ = ('opts', 'auth', 'vmcfg', 'clustercfg')
+    # guards the read-modify-write of the json cache in cached
+    cache_lock = threading.Lock()
 
     def __init__(self, opts):
         self.opts = opts
@@ -35,226 +106,352 @@ class VCTools(Logger):
         self.vmcfg = None
         self.clustercfg = None
 
+    def cache_path(self, extension):
+        """
+        Returns the path of a per vCenter file in ~/.cache/vctools.
+
+        Args:
+            extension (str): File extension, i.e. .json
+        """
+        return os.path.expanduser(
+            os.path.join('~', '.cache', 'vctools', self.opts.host + extension)
+        )
+
+    def logout(self):
+        """ Logout of vCenter, unless the session is kept for the next run. """
+        if not self.opts.keep_session:
+            self.auth.logout()
+
+    def cached(self, key, func, *errors):
+        """
+        Returns the result of func, reusing the result cached for key in
+        ~/.cache/vctools/<host>.json while it is younger than --cache-ttl.
+        If func raises one of errors, then a stale result is returned
+        instead when one exists.
+
+        Args:
+            key (str):       Name of the cached result
+            func (function): Returns a json serializable result
+            errors (tuple):  Exceptions that fall back to a stale result
+        """
+        if not self.opts.cache_ttl:
+            return func()
+
+        cache_file = self.cache_path('.json')
+        with self.cache_lock:
+            entry = self.read_cache(cache_file).get(key, None)
+        if entry and time.time() - entry['mtime'] < self.opts.cache_ttl:
+            return entry['value']
+
+        try:
+            value = func()
+        except errors as err:
+            if not entry:
+                raise
+            self.logger.error('%s, showing cached %s', err, key)
+            return entry['value']
+
+        # query jobs run at the same time, so read the file again under the
+        # lock to keep the entries the other jobs wrote meanwhile.
+        with self.cache_lock:
+            cache = self.read_cache(cache_file)
+            cache[key] = {'mtime' : time.time(), 'value' : value}
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file, 'w') as cache_stream:
+                json.dump(cache, cache_stream)
+
+        return value
+
+    @staticmethod
+    def read_cache(cache_file):
+        """
+        Returns the cached results in cache_file, or an empty dict if there
+        are none yet.
+
+        Args:
+            cache_file (str): Path of the json cache
+        """
+        try:
+            with open(cache_file) as cache_stream:
+                return json.load(cache_stream)
+        except (IOError, ValueError):
+            return {}
+
     def main(self):
         """
         This is the main method, which parses all the argparse options and runs
         the necessary code blocks if True.
         """
+        # pyVmomi loads its generated types on import, which is most of the
+        # startup time. Importing it here keeps --help and argument errors fast.
+        # pylint: disable=import-outside-toplevel
+        from pyVmomi import vim, vmodl # pylint: disable=no-name-in-module
+        from vctools.auth import Auth
+        from vctools.vmconfig_helper import VMConfigHelper
+        from vctools.clusterconfig import ClusterConfig
+        from vctools.prompts import Prompts
+        from vctools.query import Query
+        from vctools.cfgchecker import CfgCheck
 
         try:
             call_count = 0
+            # bind once, the dotrc is read in several places below
+            defaults = argparser.dotrc
 
             self.auth = Auth(self.opts.host)
-            self.auth.login(
-                self.opts.user, self.opts.passwd, self.opts.domain, self.opts.passwd_file
-            )
+            session_file = self.cache_path('.session')
+            if not (self.opts.keep_session and self.auth.resume(session_file)):
+                self.auth.login(
+                    self.opts.user, self.opts.passwd, self.opts.domain, self.opts.passwd_file
+                )
+                if self.opts.keep_session:
+                    self.auth.save_session(session_file)
 
             self.opts.passwd = None
             self.logger.debug(self.opts)
 
 
-            virtual_machines_container = Query.create_container(
-                self.auth.session, self.auth.session.content.rootFolder,
-                [vim.VirtualMachine], True
-            )
-
-            self.vmcfg = VMConfigHelper(self.auth, self.opts, argparser.dotrc)
-            self.clustercfg = ClusterConfig(self.auth, self.opts, argparser.dotrc)
+            self.vmcfg = VMConfigHelper(self.auth, self.opts, defaults)
+            if self.opts.keep_session:
+                # views live as long as the session, so the next run reuses it
+                self.vmcfg.view_file = self.cache_path('.view')
+            self.clustercfg = ClusterConfig(self.auth, self.opts, defaults)
 
-            call_count = self.auth.session.content.sessionManager.currentSession.callCount
+            session_mgr = Query.service_content(self.auth.session).sessionManager
+            call_count = session_mgr.currentSession.callCount
 
             if not self.opts.datacenter:
                 self.opts.datacenter = Prompts.datacenters(self.auth.session)
 
-            if self.opts.cmd == 'create':
+            # only one command runs, so bind it once and stop at the first match
+            cmd = self.opts.cmd
+
+            if cmd == 'create':
                 if self.opts.config:
                     for cfg in self.opts.config:
-                        spec = self.vmcfg.dict_merge(
-                            argparser.dotrc, yaml.load(cfg, Loader=yaml.FullLoader)
-                        )
+                        # libyaml reads the bytes directly, skipping the text
+                        # decoding layer
+                        with open(cfg, 'rb') as cfg_stream:
+                            spec = self.vmcfg.dict_merge(
+                                defaults, load_yaml(cfg_stream)
+                            )
                         cfgcheck_update = CfgCheck.cfg_checker(spec, self.auth, self.opts)
                         spec['vmconfig'].update(
                             self.vmcfg.dict_merge(spec['vmconfig'], cfgcheck_update)
                         )
+                        # the cluster was resolved by the checker, make sure the
+                        # folder exists too before any boot iso is built.
+                        self.vmcfg.folder_lookup(
+                            spec['vmconfig']['datacenter'], spec['vmconfig']['folder']
+                        )
                         spec = self.vmcfg.pre_create_hooks(**spec)
                         spec = self.vmcfg.create_wrapper(**spec)
                         self.vmcfg.post_create_hooks(**spec)
-                        filename = spec['vmconfig']['name'] + '.yaml'
-                        server_cfg = {}
-                        server_cfg['vmconfig'] = {}
-                        server_cfg['vmconfig'].update(spec['vmconfig'])
+                        filename = spec['vmconfig']['name'] + '.' + self.opts.dump_format
+                        # the dicts are only read while dumping, so no copies
+                        server_cfg = {'vmconfig' : spec['vmconfig']}
                         if spec.get('mkbootiso', None):
-                            server_cfg['mkbootiso'] = {}
-                            server_cfg['mkbootiso'].update(spec['mkbootiso'])
+                            server_cfg['mkbootiso'] = spec['mkbootiso']
 
-                        print(
-                            yaml.dump(server_cfg, default_flow_style=False),
-                            file=open(os.path.join(os.environ['OLDPWD'], filename), 'w')
-                        )
+                        with open(os.path.join(os.environ['OLDPWD'], filename), 'w') as cfg_file:
+                            if self.opts.dump_format == 'json':
+                                json.dump(server_cfg, cfg_file, default=str, indent=2)
+                            else:
+                                yaml.dump(
+                                    server_cfg, cfg_file, Dumper=_YDumper,
+                                    default_flow_style=False
+                                )
 
-            if self.opts.cmd == 'mount':
+            elif cmd == 'mount':
                 self.vmcfg.mount_wrapper(self.opts.datastore, self.opts.path, *self.opts.name)
 
-            if self.opts.cmd == 'power':
+            elif cmd == 'power':
                 self.vmcfg.power_wrapper(self.opts.power, *self.opts.name)
 
-            if self.opts.cmd == 'umount':
+            elif cmd == 'umount':
                 self.vmcfg.umount_wrapper(*self.opts.name)
 
-            if self.opts.cmd == 'upload':
+            elif cmd == 'upload':
                 self.vmcfg.upload_wrapper(
                     self.opts.datastore, self.opts.dest,
                     self.opts.verify_ssl, *self.opts.iso
                 )
 
-            if self.opts.cmd == 'add':
-                hostname = Query.get_obj(virtual_machines_container.view, self.opts.name)
+            elif cmd == 'add':
+                hostname = self.vmcfg.get_vms(self.opts.name)[0]
 
                 # nics
                 if self.opts.device == 'nic':
                     self.vmcfg.add_nic_recfg(hostname)
 
-            if self.opts.cmd == 'reconfig':
-                host = Query.get_obj(virtual_machines_container.view, self.opts.name)
+            elif cmd == 'reconfig':
+                host = self.vmcfg.get_vms(self.opts.name)[0]
+                # collect cfgs and device changes so they are applied in a
+                # single reconfig task.
+                config = {}
+                devices = []
                 if self.opts.cfgs:
                     self.logger.info(
                         'reconfig: %s cfgs: %s', host.name,
                         ' '.join('%s=%s' % (k, v) for k, v in self.opts.cfgs.items())
                     )
-                    self.vmcfg.reconfig(host, **self.opts.cfgs)
-                if self.opts.folder:
-                    self.vmcfg.folder_recfg()
+                    config.update(self.opts.cfgs)
                 if self.opts.device == 'disk':
-                    self.vmcfg.disk_recfg()
+                    devices.extend(self.vmcfg.disk_recfg(host))
                 if self.opts.device == 'nic':
-                    self.vmcfg.nic_recfg()
+                    devices.extend(self.vmcfg.nic_recfg(host))
+                if devices:
+                    config.update({'deviceChange' : devices})
+                if config:
+                    self.vmcfg.reconfig(host, **config)
+                if self.opts.folder:
+                    self.vmcfg.folder_recfg(host)
                 if self.opts.upgrade:
-                    self.vmcfg.hwupgrade_recfg()
+                    self.vmcfg.hwupgrade_recfg(host)
 
-            if self.opts.cmd == 'drs':
+            elif cmd == 'drs':
                 if not self.opts.cluster:
-                    self.opts.cluster = Prompts.clusters(self.auth.session)
+                    root = None
+                    if self.opts.datacenter:
+                        root = Query.get_obj(
+                            self.vmcfg.name_index(vim.Datacenter), self.opts.datacenter
+                        ).hostFolder
+                    self.opts.cluster = Prompts.clusters(self.auth.session, root)
                 self.clustercfg.drs_rule()
 
-            if self.opts.cmd == 'query':
-                datacenters_container = Query.create_container(
-                    self.auth.session, self.auth.session.content.rootFolder,
-                    [vim.Datacenter], True
+            elif cmd == 'query':
+                # name indexes built with one PropertyCollector call on first use
+                datacenters = functools.partial(self.vmcfg.name_index, vim.Datacenter)
+                clusters = functools.partial(
+                    self.vmcfg.name_index, vim.ComputeResource, self.opts.datacenter
                 )
-                clusters_container = Query.create_container(
-                    self.auth.session, self.auth.session.content.rootFolder,
-                    [vim.ClusterComputeResource], True
-                )
-
-                if self.opts.anti_affinity_rules:
-                    if self.opts.cluster:
-                        anti_affinity_rules = Query.return_anti_affinity_rules(
-                            clusters_container.view, self.opts.cluster
-                        )
-                    else:
-                        cluster = Prompts.clusters(self.auth.session)
-                        anti_affinity_rules = Query.return_anti_affinity_rules(
-                            clusters_container.view, cluster
-                        )
-                    if not anti_affinity_rules:
-                        print('No antiaffinity rules defined.')
-                    else:
-                        print('Antiaffinity rules:')
-
-                        for key, val in sorted(anti_affinity_rules.items()):
-                            print('{0}: {1}'.format(key, ' '.join(sorted(val))))
-
-                if self.opts.datastores:
-                    if self.opts.cluster:
-                        datastores = Query.return_datastores(
-                            clusters_container.view, self.opts.cluster
+                # the prompts list the same clusters as the index
+                root = None
+                if self.opts.datacenter:
+                    root = Query.get_obj(datacenters(), self.opts.datacenter).hostFolder
+
+                # the lookups below run at the same time, so prompt for anything
+                # missing before they start.
+                if not self.opts.cluster and (
+                        self.opts.anti_affinity_rules or self.opts.datastores
+                        or self.opts.networks or self.opts.vm_by_datastore
+                ):
+                    self.opts.cluster = Prompts.clusters(self.auth.session, root)
+                if self.opts.vm_by_datastore and not self.opts.datastore:
+                    self.opts.datastore = Prompts.datastores(
+                        self.auth.session, self.opts.cluster, root
+                    )
+                    print()
+
+                def anti_affinity_rules():
+                    """Lines for --anti-affinity-rules."""
+                    rules = Query.return_anti_affinity_rules(clusters(), self.opts.cluster)
+                    if not rules:
+                        return ['No antiaffinity rules defined.']
+
+                    return ['Antiaffinity rules:'] + [
+                        '{0}: {1}'.format(key, ' '.join(sorted(val)))
+                        for key, val in sorted(rules.items())
+                    ]
+
+                def datastores():
+                    """Lines for --datastores."""
+                    return [
+                        '{0:30}\t{1:10}\t{2:10}\t{3:6}\t{4:10}\t{5:6}'.format(*row)
+                        for row in Query.return_datastores(
+                            self.auth.session, clusters(), self.opts.cluster
                         )
-                    else:
-                        cluster = Prompts.clusters(self.auth.session)
-                        datastores = Query.return_datastores(clusters_container.view, cluster)
-                    for row in datastores:
-                        print('{0:30}\t{1:10}\t{2:10}\t{3:6}\t{4:10}\t{5:6}'.format(*row))
+                    ]
+
+                def folders():
+                    """Lines for --folders."""
+                    return self.cached(
+                        'folders:' + self.opts.datacenter,
+                        lambda: sorted(Query.list_vm_folders(
+                            self.auth.session, datacenters(), self.opts.datacenter
+                        )),
+                        vmodl.MethodFault, OSError
+                    )
+
+                def cluster_names():
+                    """Lines for --clusters."""
+                    return self.cached(
+                        'clusters:' + (self.opts.datacenter or ''),
+                        lambda: sorted(
+                            name for name, obj in clusters().items()
+                            if isinstance(obj, vim.ClusterComputeResource)
+                        ),
+                        vmodl.MethodFault, OSError
+                    )
+
+                def networks():
+                    """Lines for --networks."""
+                    cluster = Query.get_obj(clusters(), self.opts.cluster)
+                    return sorted(
+                        prop['name'] for prop in Query.objs_properties(
+                            self.auth.session, cluster.network, ['name']
+                        ).values()
+                    )
+
+                def vms():
+                    """Lines for --vms, yielded as the pages arrive."""
+                    for key, value in Query.iter_vm_info(
+                            self.auth.session, datacenters(), self.opts.datacenter
+                    ):
+                        yield '{0} {1}'.format(key, value)
+
+                def vm_by_datastore():
+                    """Lines for --vm-by-datastore."""
+                    return Query.vm_by_datastore(
+                        clusters(), self.opts.cluster, self.opts.datastore
+                    )
+
+                jobs = [
+                    job for enabled, job in (
+                        (self.opts.anti_affinity_rules, anti_affinity_rules),
+                        (self.opts.datastores, datastores),
+                        (self.opts.folders, folders),
+                        (self.opts.clusters, cluster_names),
+                        (self.opts.networks, networks),
+                        (self.opts.vms, vms),
+                        (self.opts.vm_by_datastore, vm_by_datastore),
+                    ) if enabled
+                ]
+
+                # a single lookup is printed as it arrives, several are fetched
+                # at the same time and printed in the order of the options.
+                if len(jobs) == 1:
+                    results = [jobs[0]()]
+                else:
+                    results = self.vmcfg.parallel(lambda job: list(job()), jobs)
+                for lines in results:
+                    for line in lines:
+                        print(line)
 
-                if self.opts.folders:
-                    if self.opts.datacenter:
-                        folders = Query.list_vm_folders(
-                            datacenters_container.view, self.opts.datacenter
-                        )
-                        folders.sort()
-                        for folder in folders:
-                            print(folder)
-                    else:
-                        datacenter = Prompts.datacenters(self.auth.session)
-                        folders = Query.list_vm_folders(datacenters_container.view, datacenter)
-                        folders.sort()
-                        for folder in folders:
-                            print(folder)
-                if self.opts.clusters:
-                    clusters = Query.list_obj_attrs(clusters_container, 'name')
-                    clusters.sort()
-                    for cluster in clusters:
-                        print(cluster)
-                if self.opts.networks:
-                    if self.opts.cluster:
-                        cluster = Query.get_obj(clusters_container.view, self.opts.cluster)
-                        networks = Query.list_obj_attrs(cluster.network, 'name', view=False)
-                        networks.sort()
-                        for net in networks:
-                            print(net)
-                    else:
-                        cluster_name = Prompts.clusters(self.auth.session)
-                        cluster = Query.get_obj(clusters_container.view, cluster_name)
-                        networks = Query.list_obj_attrs(cluster.network, 'name', view=False)
-                        networks.sort()
-                        for net in networks:
-                            print(net)
-                if self.opts.vms:
-                    vms = Query.list_vm_info(datacenters_container.view, self.opts.datacenter)
-                    for key, value in vms.items():
-                        print(key, value)
                 if self.opts.vmconfig:
+                    virtual_machines = dict(
+                        zip(self.opts.vmconfig, self.vmcfg.get_vms(*self.opts.vmconfig))
+                    )
                     for name in self.opts.vmconfig:
-                        virtmachine = Query.get_obj(virtual_machines_container.view, name)
-                        self.logger.debug(virtmachine.config)
+                        self.logger.debug(virtual_machines[name].config)
                         if self.opts.createcfg:
-                            print(
-                                yaml.dump(
-                                    Query.vm_config(
-                                        virtual_machines_container.view, name, self.opts.createcfg
-                                    ),
-                                    default_flow_style=False
-                                )
+                            yaml.dump(
+                                Query.vm_config(
+                                    virtual_machines, name, self.opts.createcfg
+                                ),
+                                sys.stdout, Dumper=_YDumper, default_flow_style=False
                             )
                         else:
-                            print(
-                                yaml.dump(
-                                    Query.vm_config(virtual_machines_container.view, name),
-                                    default_flow_style=False
-                                )
+                            yaml.dump(
+                                Query.vm_config(virtual_machines, name),
+                                sys.stdout, Dumper=_YDumper, default_flow_style=False
                             )
-                if self.opts.vm_by_datastore:
-                    if self.opts.cluster and self.opts.datastore:
-                        vms = Query.vm_by_datastore(
-                            clusters_container.view, self.opts.cluster, self.opts.datastore
-                        )
-                        for vm_name in vms:
-                            print(vm_name)
-                    else:
-                        if not self.opts.cluster:
-                            cluster = Prompts.clusters(self.auth.session)
-                        if not self.opts.datastore:
-                            datastore = Prompts.datastores(self.auth.session, cluster)
-                        print()
-
-                        vms = Query.vm_by_datastore(clusters_container.view, cluster, datastore)
-                        for vm_name in vms:
-                            print(vm_name)
-
                 if self.opts.vm_guest_ids:
                     for guest_id in Query.list_guestids():
                         print(guest_id)
 
-            self.auth.logout()
+            self.vmcfg.destroy()
+            self.logout()
             self.logger.debug('Call count: {0}'.format(call_count))
 
         except ssl.CertificateError as err:
@@ -263,7 +460,10 @@ class VCTools(Logger):
 
         except ValueError as err:
             self.logger.error(err, exc_info=False)
-            self.auth.logout()
+            # stop the mkbootiso pool and remove the view on errors as well
+            if self.vmcfg:
+                self.vmcfg.destroy()
+            self.logout()
             self.logger.debug('Call count: {0}'.format(call_count))
             sys.exit(3)
 
@@ -273,19 +473,26 @@ class VCTools(Logger):
 
         except KeyboardInterrupt as err:
             self.logger.error(err, exc_info=False)
-            self.auth.logout()
+            if self.vmcfg:
+                self.vmcfg.destroy()
+            self.logout()
             self.logger.debug('Call count: {0}'.format(call_count))
             sys.exit(1)
 
 
 if __name__ == '__main__':
     vctools_dir = os.path.dirname(os.path.realpath(__file__))
+    # the version needs no dotrc or parsers, so answer it right away
+    if sys.argv[1:] in (['-v'], ['--version']):
+        sys.stdout.write(VersionAction.revision(os.path.join(vctools_dir, '.git')))
+        sys.exit(0)
+
     grouprc = vctools_dir + '/' + 'vctoolsrc.yaml'
     homerc = '~/.vctoolsrc.yaml'
     rc_files = [grouprc, homerc]
     for rc_file in rc_files:
         try:
-            dotrc = yaml.load(open(os.path.expanduser(rc_file)), Loader=yaml.FullLoader)
+            dotrc = load_rc(os.path.expanduser(rc_file))
         except IOError:
             # if it does not exist, then skip it
             pass
@@ -294,7 +501,7 @@ if __name__ == '__main__':
 
     rcfile = argparser.parser.parse_args().rcfile
     if rcfile:
-        argparser(**yaml.load(rcfile, Loader=yaml.FullLoader))
+        argparser(**load_rc(rcfile))
     options = argparser.sanitize(argparser.parser.parse_args())
 
     log_level = options.level.upper()
@@ -3,6 +3,9 @@
 """ Logging metaclass."""
 import logging
 
+# every class shares the package logger, so look it up once at import.
+_LOGGER = logging.getLogger(__name__)
+
 class Log(type):
     """ Metaclass that will load all plugins. """
     def __init__(cls, name, args, kwargs):
@@ -14,9 +17,11 @@ class Log(type):
         """
         super(Log, cls).__init__(name, args, kwargs)
 
-        cls.logger = logging.getLogger(__name__)
+        cls.logger = _LOGGER
 
 
 # pylint: disable=too-few-public-methods
 class Logger(metaclass=Log):
     """ Allows any class to easily have logging. """
+    # leave the instance layout to subclasses, so they may use __slots__
+    __slots__ = ()
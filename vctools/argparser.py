@@ -3,34 +3,119 @@
 """Class for handling argparse parsers. Methods are configured as subparsers."""
 import argparse
 import os
-import subprocess
 import sys
 import textwrap
 from vctools import Logger
 
+# relative config paths are taken from where vctools was started, see
+# ArgParser._fix_file_paths
+OLDPWD = os.environ.get('OLDPWD', '')
+# --cfgs values that are turned into bools
+BOOLS = {'True' : True, 'False' : False}
+
+class VersionAction(argparse.Action):
+    """
+    Prints the git revision of vctools.  Asking git is left until --version
+    is actually given, so other runs do not spawn a process for it.
+    """
+    # pylint: disable=redefined-builtin
+    def __init__(self, option_strings, git_dir, dest=argparse.SUPPRESS,
+                 default=argparse.SUPPRESS, help=None):
+        super(VersionAction, self).__init__(
+            option_strings=option_strings, dest=dest, default=default, nargs=0,
+            help=help
+        )
+        self.git_dir = git_dir
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        # like argparse's own version action, print to stdout and not stderr
+        # pylint: disable=protected-access
+        parser._print_message(self.revision(self.git_dir), sys.stdout)
+        parser.exit()
+
+    @staticmethod
+    def revision(git_dir):
+        """
+        Returns the short git revision of HEAD.  HEAD and the branch it points
+        to are read directly, git itself is only asked when that fails, i.e.
+        for packed refs.
+
+        Args:
+            git_dir (str): Path to the .git directory of vctools
+        """
+        try:
+            with open(os.path.join(git_dir, 'HEAD')) as head:
+                ref = head.read().strip()
+            if ref.startswith('ref: '):
+                with open(os.path.join(git_dir, ref[5:])) as branch:
+                    ref = branch.read().strip()
+            return ref[:7] + '\n'
+        except IOError:
+            # only needed for this fallback, so it is not imported on startup
+            import subprocess # pylint: disable=import-outside-toplevel
+            return subprocess.check_output(
+                ['git', '--git-dir', git_dir, 'rev-parse', '--short', 'HEAD']
+            ).decode('utf-8')
+
+
 class ArgParser(Logger):
     """Argparser class. It handles the user inputs and config files."""
+    # query options in the order query -h lists them
+    query_options = (
+        ('--anti-affinity-rules', {
+            'action' : 'store_true', 'help' : 'Returns information about AntiAffinityRules.'
+        }),
+        ('--datastores', {
+            'action' : 'store_true', 'help' : 'Returns information about Datastores.'
+        }),
+        ('--datastore', {'metavar' : '', 'help' : 'vCenter Datastore.'}),
+        ('--vms', {
+            'action' : 'store_true', 'help' : 'Returns information about Virtual Machines.'
+        }),
+        ('--folders', {
+            'action' : 'store_true', 'help' : 'Returns information about Folders.'
+        }),
+        ('--networks', {
+            'action' : 'store_true', 'help' : 'Returns information about Networks.'
+        }),
+        ('--clusters', {
+            'action' : 'store_true', 'help' : 'Returns information about ComputeResources.'
+        }),
+        ('--cluster', {'metavar' : '', 'help' : 'vCenter ComputeResource.'}),
+        ('--vmconfig', {'nargs' : '+', 'metavar' : '', 'help' : 'Virtual machine config'}),
+        ('--vm-by-datastore', {
+            'action' : 'store_true', 'help' : 'List the VMs associated with datastore.'
+        }),
+        ('--vm-guest-ids', {'action' : 'store_true', 'help' : 'Show all vm guest ids.'}),
+    )
+    # shared by the options that appear on several subcommands
+    nic_drivers = ('vmxnet3', 'e1000')
+    name_help = 'name attribute of Virtual Machine object.'
+    # parent parsers whose options are accessible to all subparsers
+    parent_parsers = ('general', 'logging')
+    # subcommands and their help, listed by the top level help
+    commands = {
+        'add' : 'Add Hardware to Virtual Machines.',
+        'create' : 'Create Virtual Machines',
+        'drs' : 'Cluster DRS rules',
+        'mount' : 'Mount ISO to CD-Rom device',
+        'power' : 'Power Management for Virtual Machines',
+        'query' : 'Query Info',
+        'reconfig' : 'Reconfigure Attributes for Virtual Machines.',
+        'umount' : 'Unmount ISO from CD-Rom device',
+        'upload' : 'Upload File',
+    }
+
     def __init__(self):
         self.syspath = sys.path[0]
-        self.__version__ = subprocess.check_output(
-            [
-                'git', '--git-dir', self.syspath + '/.git', 'rev-parse', '--short', 'HEAD'
-            ]
-        ).decode('utf-8')
-
-        self.parser = argparse.ArgumentParser(
-            description='vCenter Tools CLI'
-        )
-        self.parser.add_argument(
-            '--version', '-v', action='version',
-            version=self.__version__,
-            help='version number'
-        )
-        self.subparsers = self.parser.add_subparsers(metavar='')
 
+        self.parser = None
+        self.subparsers = None
         self.help = None
         self.opts = None
         self.dotrc = None
+        # parent parser name as key, its defaults and parser as value
+        self.parent_cache = {}
 
     def __call__(self, **dotrc):
         """
@@ -42,33 +127,62 @@ class ArgParser(Logger):
         """
         self.dotrc = dotrc
 
-        # parent_parsers are accessible to all subparsers
-        parent_parsers = ['general', 'logging']
-        parents = []
+        # a later call, i.e. for an --rcfile, adds the subcommand again, so it
+        # needs a fresh top level parser to avoid a conflicting subparser.
+        self.parser = argparse.ArgumentParser(
+            description='vCenter Tools CLI'
+        )
+        self.parser.add_argument(
+            '--version', '-v', action=VersionAction,
+            git_dir=os.path.join(self.syspath, '.git'),
+            help='version number'
+        )
+        self.subparsers = self.parser.add_subparsers(metavar='')
+
+        # the first positional argument is the subcommand, so only its parser
+        # needs building. The top level help and invalid commands only list
+        # the subcommands, so they get empty placeholders.
+        command = next((arg for arg in sys.argv[1:] if not arg.startswith('-')), None)
+        if command not in self.commands:
+            for name, text in self.commands.items():
+                self.subparsers.add_parser(name, help=text)
+            return
 
-        # subparsers are methods that create positional arguments
-        subparsers = [
-            'add', 'create', 'drs', 'mount', 'power', 'query', 'reconfig', 'umount', 'upload'
+        # load parsers and subparsers and override with dotrc dict
+        parents = [
+            self._parent_parser(parent, **dotrc.get(parent, {}))
+            for parent in self.parent_parsers
         ]
+        getattr(self, command)(*parents, **dotrc.get(command, {}))
 
-        # load parsers and subparsers and override with dotrc dict
-        for parent in parent_parsers:
-            if self.dotrc:
-                if parent in list(self.dotrc.keys()):
-                    parents.append(getattr(self, str(parent))(**self.dotrc[str(parent)]))
-                else:
-                    parents.append(getattr(self, str(parent))())
-            else:
-                parents.append(getattr(self, str(parent))())
-
-        for parser in subparsers:
-            if self.dotrc:
-                if parser in list(self.dotrc.keys()):
-                    getattr(self, str(parser))(*parents, **self.dotrc[str(parser)])
-                else:
-                    getattr(self, str(parser))(*parents)
-            else:
-                getattr(self, str(parser))(*parents)
+    def _parent_parser(self, name, **defaults):
+        """
+        Internal method that returns the parent parser built by the method
+        name.  A later call, i.e. for an --rcfile, reuses the parser as long
+        as its defaults did not change.
+
+        Args:
+            name (str):      general or logging
+            defaults (dict): The argument overrides from a dotrc.
+        """
+        cached = self.parent_cache.get(name)
+        if cached is None or cached[0] != defaults:
+            cached = (defaults, getattr(self, name)(**defaults))
+            self.parent_cache[name] = cached
+
+        return cached[1]
+
+    @staticmethod
+    def _file_path(args):
+        """
+        Internal method that checks a file exists and returns its path.  The
+        file is opened later by the code that reads it.
+        """
+        path = os.path.expanduser(args)
+        if not os.path.isfile(path):
+            raise argparse.ArgumentTypeError("can't open '%s'" % (args))
+
+        return path
 
     @staticmethod
     def _fix_file_paths(args):
@@ -77,33 +191,24 @@ class ArgParser(Logger):
         cd subshell and pipenv.
         """
         if not args.startswith(('/', '~')):
-            args = os.path.join(os.environ['OLDPWD'], args)
+            args = os.path.join(OLDPWD, args)
 
-        return open(args, 'r')
+        return ArgParser._file_path(args)
 
     @staticmethod
     def _mkdict(args):
         """
         Internal method for converting an argparse string key=value into dict.
-        It passes each value through a for loop to correctly set its type,
-        otherwise it returns it as a string.
+        Digits become ints and True or False become bools, otherwise the
+        value is kept as a string.
 
         Example:
             key1=val1,key2=val2,key3=val3
         """
-
-        params = dict(x.split('=') for x in args.split(','))
-
-        for key, value in params.items():
-            if params[key].isdigit():
-                params[key] = int(value)
-            else:
-                if params[key] == 'True':
-                    params[key] = True
-                elif params[key] == 'False':
-                    params[key] = False
-
-        return params
+        return {
+            key : int(value) if value.isdigit() else BOOLS.get(value, value)
+            for key, value in (pair.split('=', 1) for pair in args.split(','))
+        }
 
     @classmethod
     def general(cls, **defaults):
@@ -140,7 +245,7 @@ class ArgParser(Logger):
         )
 
         genopts.add_argument(
-            '--rcfile', metavar='', type=argparse.FileType('r'),
+            '--rcfile', metavar='', type=cls._file_path,
             help='A custom config for vctools options'
         )
 
@@ -149,6 +254,17 @@ class ArgParser(Logger):
             help='vCenter Datacenter'
         )
 
+        genopts.add_argument(
+            '--keep-session', action='store_true',
+            help='reuse the vCenter session across runs instead of logging in '
+                 'and out every time'
+        )
+
+        genopts.add_argument(
+            '--parallel', metavar='', type=int, default=1,
+            help='number of VMs or isos handled at once. default: %(default)s'
+        )
+
         if defaults:
             general_parser.set_defaults(**defaults)
 
@@ -163,16 +279,16 @@ class ArgParser(Logger):
         logging_opts = logging_parser.add_argument_group('logging options')
 
         logging_opts.add_argument(
-            '--level', metavar='', choices=['info', 'debug'], default='info',
+            '--level', metavar='', choices=('info', 'debug'), default='info',
             help='set logging level choices=[%(choices)s] default: %(default)s'
         )
 
         logging_opts.add_argument(
-            '--console-level', metavar='', choices=['info', 'error', 'debug'], default='error',
+            '--console-level', metavar='', choices=('info', 'error', 'debug'), default='error',
             help='set console log level choices=[%(choices)s] default: %(default)s'
         )
         logging_opts.add_argument(
-            '--console-stream', metavar='', choices=['stdout', 'stderr'], default='stderr',
+            '--console-stream', metavar='', choices=('stdout', 'stderr'), default='stderr',
             help='set console logging stream output choices=[%(choices)s] default: %(default)s'
         )
 
@@ -200,11 +316,11 @@ class ArgParser(Logger):
         """
         add_parser = self.subparsers.add_parser(
             'add',
-            parents=list(parents),
+            parents=parents,
             formatter_class=argparse.RawDescriptionHelpFormatter,
             usage=textwrap.dedent(usage),
             description=textwrap.dedent(self.add.__doc__),
-            help='Add Hardware to Virtual Machines.'
+            help=self.commands['add']
         )
 
         add_parser.set_defaults(cmd='add')
@@ -217,7 +333,7 @@ class ArgParser(Logger):
         )
 
         add_type_opts.add_argument(
-            '--device', metavar='', choices=['nic'],
+            '--device', metavar='', choices=('nic',),
             help='Add hardware devices on Virtual Machines. choices=[%(choices)s]',
         )
 
@@ -229,7 +345,7 @@ class ArgParser(Logger):
         )
 
         add_nic_opts.add_argument(
-            '--driver', metavar='', choices=['vmxnet3', 'e1000'],
+            '--driver', metavar='', choices=self.nic_drivers,
             help='The network driver, default: vmxnet3'
         )
 
@@ -240,9 +356,9 @@ class ArgParser(Logger):
         """Create Parser."""
         # create
         create_parser = self.subparsers.add_parser(
-            'create', parents=list(parents),
+            'create', parents=parents,
             description='Example: vctools create <vc> <config> <configN>',
-            help='Create Virtual Machines'
+            help=self.commands['create']
         )
 
         create_parser.set_defaults(cmd='create')
@@ -257,6 +373,12 @@ class ArgParser(Logger):
             help='Power on the VM after creation. default: %(default)s'
         )
 
+        create_parser.add_argument(
+            '--dump-format', metavar='', choices=('yaml', 'json'), default='yaml',
+            help='format of the saved VM config. json is faster to write and can '
+                 'be read back by create. choices=[%(choices)s] default: %(default)s'
+        )
+
         if defaults:
             create_parser.set_defaults(**defaults)
 
@@ -264,8 +386,8 @@ class ArgParser(Logger):
         """Mount Parser."""
         # mount
         mount_parser = self.subparsers.add_parser(
-            'mount', parents=list(parents),
-            help='Mount ISO to CD-Rom device'
+            'mount', parents=parents,
+            help=self.commands['mount']
         )
 
         mount_parser.set_defaults(cmd='mount')
@@ -282,7 +404,7 @@ class ArgParser(Logger):
 
         mount_parser.add_argument(
             '--name', nargs='+', metavar='',
-            help='name attribute of Virtual Machine object.'
+            help=self.name_help
         )
 
         if defaults:
@@ -292,21 +414,21 @@ class ArgParser(Logger):
         """Power Parser."""
         # power
         power_parser = self.subparsers.add_parser(
-            'power', parents=list(parents),
-            help='Power Management for Virtual Machines'
+            'power', parents=parents,
+            help=self.commands['power']
         )
 
         power_parser.set_defaults(cmd='power')
 
         power_parser.add_argument(
-            'power', choices=['on', 'off', 'reset', 'reboot', 'shutdown'],
+            'power', choices=('on', 'off', 'reset', 'reboot', 'shutdown'),
             help='change power state of VM'
 
         )
 
         power_parser.add_argument(
             '--name', nargs='+', metavar='',
-            help='name attribute of Virtual Machine object.'
+            help=self.name_help
         )
 
         if defaults:
@@ -316,66 +438,21 @@ class ArgParser(Logger):
         """Query Parser."""
         # query
         query_parser = self.subparsers.add_parser(
-            'query', parents=list(parents),
-            help='Query Info'
+            'query', parents=parents,
+            help=self.commands['query']
         )
 
         query_parser.set_defaults(cmd='query')
 
         query_opts = query_parser.add_argument_group('query options')
 
-        query_opts.add_argument(
-            '--anti-affinity-rules', action='store_true',
-            help='Returns information about AntiAffinityRules.'
-        )
-
-        query_opts.add_argument(
-            '--datastores', action='store_true',
-            help='Returns information about Datastores.'
-        )
-
-        query_opts.add_argument(
-            '--datastore', metavar='',
-            help='vCenter Datastore.'
-        )
+        for flag, options in self.query_options:
+            query_opts.add_argument(flag, **options)
 
         query_opts.add_argument(
-            '--vms', action='store_true',
-            help='Returns information about Virtual Machines.'
-        )
-
-        query_opts.add_argument(
-            '--folders', action='store_true',
-            help='Returns information about Folders.'
-        )
-
-        query_opts.add_argument(
-            '--networks', action='store_true',
-            help='Returns information about Networks.'
-        )
-
-        query_opts.add_argument(
-            '--clusters', action='store_true',
-            help='Returns information about ComputeResources.'
-        )
-
-        query_opts.add_argument(
-            '--cluster', metavar='',
-            help='vCenter ComputeResource.'
-        )
-
-        query_opts.add_argument(
-            '--vmconfig', nargs='+', metavar='',
-            help='Virtual machine config'
-        )
-
-        query_opts.add_argument(
-            '--vm-by-datastore', action='store_true',
-            help='List the VMs associated with datastore.'
-        )
-        query_opts.add_argument(
-            '--vm-guest-ids', action='store_true',
-            help='Show all vm guest ids.'
+            '--cache-ttl', metavar='', type=int, default=0,
+            help='seconds to reuse cached --clusters and --folders results, a '
+                 'stale result is shown if vCenter fails. default: %(default)s'
         )
 
         query_vmcfg_opts = query_parser.add_argument_group('vmconfig options')
@@ -416,11 +493,11 @@ class ArgParser(Logger):
         """
         reconfig_parser = self.subparsers.add_parser(
             'reconfig',
-            parents=list(parents),
+            parents=parents,
             formatter_class=argparse.RawDescriptionHelpFormatter,
             usage=textwrap.dedent(usage),
             description=textwrap.dedent(self.reconfig.__doc__),
-            help='Reconfigure Attributes for Virtual Machines.'
+            help=self.commands['reconfig']
         )
         reconfig_parser.set_defaults(cmd='reconfig')
 
@@ -432,7 +509,7 @@ class ArgParser(Logger):
         )
 
         reconfig_type_opts.add_argument(
-            '--device', metavar='', choices=['disk', 'nic'],
+            '--device', metavar='', choices=('disk', 'nic'),
             help='Reconfigure hardware devices on Virtual Machines. choices=[%(choices)s]',
         )
 
@@ -479,7 +556,7 @@ class ArgParser(Logger):
         )
         reconfig_nic_opts.add_argument(
             '--driver', metavar='', default='vmxnet3',
-            choices=['vmxnet3', 'e1000'],
+            choices=self.nic_drivers,
             help='The network driver, default: \"%(default)s\"'
         )
         reconfig_type_opts.add_argument(
@@ -499,7 +576,7 @@ class ArgParser(Logger):
         )
         reconfig_upgrade_opts.add_argument(
             '--policy', metavar='', default='always',
-            choices=['always', 'never', 'on_soft_poweroff'],
+            choices=('always', 'never', 'on_soft_poweroff'),
             help='The upgrade policy to use with scheduling. ' +
             'choices: \"%(choices)s\" ' + 'default: \"%(default)s\" '
         )
@@ -511,15 +588,15 @@ class ArgParser(Logger):
         """ Umount Parser """
         # umount
         umount_parser = self.subparsers.add_parser(
-            'umount', parents=list(parents),
-            help='Unmount ISO from CD-Rom device'
+            'umount', parents=parents,
+            help=self.commands['umount']
         )
 
         umount_parser.set_defaults(cmd='umount')
 
         umount_parser.add_argument(
             '--name', nargs='+',
-            help='name attribute of Virtual Machine object.'
+            help=self.name_help
         )
         if defaults:
             umount_parser.set_defaults(**defaults)
@@ -528,8 +605,8 @@ class ArgParser(Logger):
         """ Upload Parser """
         # upload
         upload_parser = self.subparsers.add_parser(
-            'upload', parents=list(parents),
-            help='Upload File'
+            'upload', parents=parents,
+            help=self.commands['upload']
         )
         upload_parser.set_defaults(cmd='upload')
 
@@ -571,21 +648,21 @@ class ArgParser(Logger):
         """
 
         drs_parser = self.subparsers.add_parser(
-            'drs', parents=list(parents),
+            'drs', parents=parents,
             formatter_class=argparse.RawDescriptionHelpFormatter,
             usage=textwrap.dedent(usage),
             description=textwrap.dedent(self.drs.__doc__),
-            help='Cluster DRS rules'
+            help=self.commands['drs']
         )
 
         drs_parser.set_defaults(cmd='drs')
 
         drs_parser.add_argument(
-            'drs_type', choices=['anti-affinity'],
+            'drs_type', choices=('anti-affinity',),
             help='options: anti-affinity (other options may come later)'
         )
         drs_parser.add_argument(
-            'function', choices=['add', 'delete'],
+            'function', choices=('add', 'delete'),
             help='options: add|delete'
         )
         drs_parser.add_argument(
@@ -624,28 +701,12 @@ class ArgParser(Logger):
             if not opts.name.startswith(opts.prefix):
                 opts.name = opts.prefix + opts.name
 
-        # mount path needs to point to an iso, and it doesn't make sense to add
-        # to the dotrc file, so this will append the self.opts.name value to it
-        if opts.cmd == 'mount':
-            for host in opts.name:
-                if not opts.path.endswith('.iso'):
-                    if opts.path.endswith('/'):
-                        opts.path = opts.path + host + '.iso'
-                    else:
-                        opts.path = opts.path +'/'+ host +'.iso'
-                # path is relative in vsphere, so we strip off the first char.
-                if opts.path.startswith('/'):
-                    opts.path = opts.path.lstrip('/')
-
-        if opts.cmd == 'upload':
-            # trailing slash is in upload method, so we strip it out here.
-            if opts.dest.endswith('/'):
-                opts.dest = opts.dest.rstrip('/')
-            # path is relative in vsphere, so we strip off the first character.
-            if opts.dest.startswith('/'):
-                opts.dest = opts.dest.lstrip('/')
-            # verify_ssl needs to be a boolean value.
-            if opts.verify_ssl:
-                opts.verify_ssl = bool(self.dotrc['upload']['verify_ssl'])
+        # the mount path is completed per VM inside mount_wrapper, and the
+        # upload dest is made relative inside upload_wrapper.
+        elif opts.cmd == 'upload':
+            # verify_ssl needs to be a boolean value, the dotrc default already
+            # is one but the command line passes a string.
+            if not isinstance(opts.verify_ssl, bool):
+                opts.verify_ssl = str(opts.verify_ssl).lower() in ('true', 'yes', '1')
 
         return opts
@@ -7,9 +7,10 @@ import subprocess
 from getpass import getpass, getuser
 import ssl
 import requests
-from pyVim.connect import SmartConnect, Disconnect
+from pyVim.connect import SmartConnect, SmartStubAdapter, Disconnect
 from pyVmomi import vim # pylint: disable=E0611
 from vctools import Logger
+from vctools.query import Query
 
 # disable SSL warnings
 requests.packages.urllib3.disable_warnings()
@@ -107,6 +108,64 @@ class Auth(Logger):
             passwd = None
             raise
 
+    def resume(self, session_file):
+        """
+        Resumes a session saved by save_session, so that repeated runs do not
+        need to login again.
+
+        Args:
+            session_file (str): File that holds the session cookie.
+
+        Returns:
+            resumed (bool): True if the saved session is still logged in.
+        """
+        try:
+            with open(session_file) as session_stream:
+                cookie = session_stream.read().strip()
+        except IOError:
+            return False
+
+        # same ssl fallback as login
+        contexts = [None]
+        if hasattr(ssl, '_create_unverified_context'):
+            contexts.append(ssl._create_unverified_context())
+
+        for context in contexts:
+            # the stub negotiates the API version when it is created, so it
+            # can fail on ssl the same as the first call.
+            try:
+                stub = SmartStubAdapter(host=self.host, port=self.port, sslContext=context)
+                stub.cookie = cookie
+                session = vim.ServiceInstance('ServiceInstance', stub)
+                # kept on the stub, so later lookups reuse this round-trip
+                if Query.service_content(session).sessionManager.currentSession:
+                    self.session = session
+                    self.logger.info('%s session resumed', self.host)
+                    return True
+                return False
+            except ssl.SSLError:
+                continue
+            # anything else means the session cannot be used, so login again
+            except Exception as err: # pylint: disable=broad-except
+                self.logger.debug('%s session not resumed: %s', self.host, err)
+                return False
+
+        return False
+
+    def save_session(self, session_file):
+        """
+        Saves the session cookie, readable only by the user, for resume.
+
+        Args:
+            session_file (str): File that holds the session cookie.
+        """
+        os.makedirs(os.path.dirname(session_file), mode=0o700, exist_ok=True)
+        fdesc = os.open(session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        # an existing file keeps its old mode otherwise
+        os.fchmod(fdesc, 0o600)
+        with os.fdopen(fdesc, 'w') as session_stream:
+            session_stream.write(self.session._stub.cookie)
+
     def logout(self):
         """Logout of vSphere."""
         self.logger.info('successful')
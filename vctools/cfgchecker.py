@@ -19,10 +19,23 @@ class CfgCheck:
         Args:
             cfg    (obj): Yaml object
         """
-        clusters = Query.create_container(
-            auth.session, auth.session.content.rootFolder,
-            [vim.ComputeResource], True
+        # when the datacenter is known only its host folder needs searching, and
+        # the prompts below search the same folder so their choices match
+        content = Query.service_content(auth.session)
+        root = content.rootFolder
+        if opts.datacenter:
+            datacenter_obj = content.searchIndex.FindChild(root, opts.datacenter)
+            if datacenter_obj:
+                root = datacenter_obj.hostFolder
+
+        clusters_container = Query.create_container(
+            auth.session, root, [vim.ComputeResource], True
         )
+        # one PropertyCollector call for every cluster name
+        clusters = Query.get_inventory(
+            auth.session, clusters_container, vim.ComputeResource
+        )[vim.ComputeResource]
+        clusters_container.Destroy()
         # name
         if 'vmconfig' in cfg:
 
@@ -40,16 +53,16 @@ class CfgCheck:
             # cluster
             if 'cluster' in cfg['vmconfig']:
                 cluster = cfg['vmconfig']['cluster']
-                cluster_obj = Query.get_obj(clusters.view, cluster)
+                cluster_obj = Query.get_obj(clusters, cluster)
             else:
-                cluster = Prompts.clusters(auth.session)
-                cluster_obj = Query.get_obj(clusters.view, cluster)
+                cluster = Prompts.clusters(auth.session, root)
+                cluster_obj = Query.get_obj(clusters, cluster)
                 print('\n%s cluster selected.' % (cluster))
             # datastore
             if 'datastore' in cfg['vmconfig']:
                 datastore = cfg['vmconfig']['datastore']
             else:
-                datastore = Prompts.datastores(auth.session, cluster)
+                datastore = Prompts.datastores(auth.session, cluster, root)
                 print('\n%s datastore selected.' % (datastore))
             # datacenter
             if not opts.datacenter:
@@ -62,7 +75,7 @@ class CfgCheck:
                 nics = cfg['vmconfig']['nics']
                 print('nics: %s' % (nics))
             else:
-                nics = Prompts.networks(cluster_obj)
+                nics = Prompts.networks(auth.session, cluster_obj)
                 print('\n%s networks selected.' % (','.join(nics)))
             # folder
             if 'folder' in cfg['vmconfig']:
@@ -74,13 +87,14 @@ class CfgCheck:
             name = Prompts.name()
             guestid = Prompts.guestids()
             print('\n%s selected.' % (guestid))
-            cluster = Prompts.clusters(auth.session)
+            cluster = Prompts.clusters(auth.session, root)
+            cluster_obj = Query.get_obj(clusters, cluster)
             print('\n%s selected.' % (cluster))
-            datastore = Prompts.datastores(auth.session, cluster)
+            datastore = Prompts.datastores(auth.session, cluster, root)
             print('\n%s selected.' % (datastore))
             datacenter = Prompts.datacenters(auth.session)
             print('\n%s selected.' % (datacenter))
-            nics = Prompts.networks(cluster_obj)
+            nics = Prompts.networks(auth.session, cluster_obj)
             print('\n%s selected.' % (','.join(nics)))
             folder = Prompts.folders(auth.session, datacenter)
             print('\n%s selected.' % (folder))
@@ -42,18 +42,20 @@ class ClusterConfig(Logger):
 
         self.logger.debug(cluster, drs_type, name, vms, function)
 
-        # containers we need
-        clusters = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.ComputeResource], True
+        # name indexes we need, built with one PropertyCollector call
+        inventory = Query.create_container(
+            self.auth.session, Query.service_content(self.auth.session).rootFolder,
+            [vim.ComputeResource, vim.VirtualMachine], True
         )
-        virtual_machines = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.VirtualMachine], True
+        indexes = Query.get_inventory(
+            self.auth.session, inventory, vim.ComputeResource, vim.VirtualMachine
         )
+        inventory.Destroy()
+        clusters = indexes[vim.ComputeResource]
+        virtual_machines = indexes[vim.VirtualMachine]
 
         # our cluster object
-        cluster_obj = Query.get_obj(clusters.view, cluster)
+        cluster_obj = Query.get_obj(clusters, cluster)
 
         if drs_type == 'anti-affinity':
 
@@ -61,7 +63,7 @@ class ClusterConfig(Logger):
 
                 vm_obj_list = []
                 for vm_obj in vms:
-                    vm_obj_list.append(Query.get_obj(virtual_machines.view, vm_obj))
+                    vm_obj_list.append(Query.get_obj(virtual_machines, vm_obj))
 
                 # check to see if this rule name is in use
                 if Query.is_anti_affinity_rule(cluster_obj, name):
@@ -28,7 +28,7 @@ class Prompts(Logger):
         return input('Name: ')
 
     @classmethod
-    def networks(cls, net_obj):
+    def networks(cls, session, net_obj):
         """
         Method will prompt user to select a networks. Since multiple networks
         can be added to a VM, it will prompt the user to exit or add more.
@@ -46,8 +46,10 @@ class Prompts(Logger):
             selected_networks (list): A list of selected networks
         """
         if getattr(net_obj, 'network'):
-            networks = Query.list_obj_attrs(net_obj.network, 'name', view=False)
-            networks.sort()
+            networks = sorted(
+                prop['name'] for prop in
+                Query.objs_properties(session, net_obj.network, ['name']).values()
+            )
         else:
             raise ValueError('network managed object not found in %s' % (type(net_obj)))
 
@@ -93,21 +95,29 @@ class Prompts(Logger):
 
 
     @classmethod
-    def datastores(cls, session, cluster):
+    def datastores(cls, session, cluster, root=None):
         """
         Method will prompt user to select a datastore from a cluster
 
         Args:
             session (obj): Auth session object
             cluster (str): Name of cluster
+            root (obj):    Folder to search for the cluster, defaults to the
+                rootFolder.
 
         Returns:
             datastore (str): Name of selected datastore
         """
         clusters = Query.create_container(
-            session, session.content.rootFolder, [vim.ComputeResource], True
+            session, root or Query.service_content(session).rootFolder,
+            [vim.ComputeResource], True
+        )
+        datastores = Query.return_datastores(
+            session,
+            Query.get_inventory(session, clusters, vim.ComputeResource)[vim.ComputeResource],
+            cluster
         )
-        datastores = Query.return_datastores(clusters.view, cluster)
+        clusters.Destroy()
 
         print('\n')
         if (len(datastores) -1) == 0:
@@ -150,12 +160,15 @@ class Prompts(Logger):
             folder (str): Name of selected folder
         """
         datacenters = Query.create_container(
-            session, session.content.rootFolder,
+            session, Query.service_content(session).rootFolder,
             [vim.Datacenter], True
         )
         folders = Query.list_vm_folders(
-            datacenters.view, datacenter
+            session,
+            Query.get_inventory(session, datacenters, vim.Datacenter)[vim.Datacenter],
+            datacenter
         )
+        datacenters.Destroy()
         folders.sort()
 
         for num, opt in enumerate(folders, start=1):
@@ -192,11 +205,13 @@ class Prompts(Logger):
             datacenter (str): Name of selected datacenter
         """
         datacenters_choices = Query.create_container(
-            session, session.content.rootFolder,
+            session, Query.service_content(session).rootFolder,
             [vim.Datacenter], True
         )
-        datacenters = Query.list_obj_attrs(datacenters_choices, 'name')
-        datacenters.sort()
+        datacenters = sorted(
+            Query.get_inventory(session, datacenters_choices, vim.Datacenter)[vim.Datacenter]
+        )
+        datacenters_choices.Destroy()
 
         for num, opt in enumerate(datacenters, start=1):
             print('%s: %s' % (num, opt))
@@ -218,22 +233,26 @@ class Prompts(Logger):
 
 
     @classmethod
-    def clusters(cls, session):
+    def clusters(cls, session, root=None):
         """
         Method will prompt user to select a cluster
 
         Args:
             session (obj): Auth session object
+            root (obj):    Folder to search for clusters, i.e. the hostFolder
+                of a datacenter. Defaults to the rootFolder.
 
         Returns:
             cluster (str): Name of selected cluster
         """
         clusters_choices = Query.create_container(
-            session, session.content.rootFolder,
+            session, root or Query.service_content(session).rootFolder,
             [vim.ComputeResource], True
         )
-        clusters = Query.list_obj_attrs(clusters_choices, 'name')
-        clusters.sort()
+        clusters = sorted(
+            Query.get_inventory(session, clusters_choices, vim.ComputeResource)[vim.ComputeResource]
+        )
+        clusters_choices.Destroy()
 
         for num, opt in enumerate(clusters, start=1):
             print('%s: %s' % (num, opt))
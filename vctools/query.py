@@ -3,7 +3,7 @@
 """Query class for vctools.  All methods that obtain info should go here."""
 
 
-from pyVmomi import vim # pylint: disable=no-name-in-module
+from pyVmomi import vim, vmodl # pylint: disable=no-name-in-module
 from vctools import Logger
 
 class Query(Logger):
@@ -14,6 +14,26 @@ class Query(Logger):
     def __init__(self):
         pass
 
+    @classmethod
+    def service_content(cls, s_instance):
+        """
+        Returns the ServiceContent of s_instance.  Reading the content
+        attribute is a round-trip every time, and it does not change during a
+        session, so it is retrieved once and kept on the session's stub.
+        Every ServiceInstance has the same moId, so it cannot be used to tell
+        sessions apart.
+
+        Args:
+            s_instance (obj): ServiceInstance
+        """
+        stub = s_instance._stub # pylint: disable=protected-access
+        content = getattr(stub, 'service_content', None)
+        if content is None:
+            content = s_instance.RetrieveContent()
+            stub.service_content = content
+
+        return content
+
     @classmethod
     def disk_size_format(cls, num):
         """
@@ -30,6 +50,24 @@ class Query(Logger):
         return None
 
 
+    @classmethod
+    def iso_path(cls, path, name):
+        """
+        Method returns the datastore path of the ISO for name.  If path does
+        not point to an iso, then name.iso is appended to it.  Paths are
+        relative in vSphere, so the leading slash is removed.
+
+        Args:
+            path (str): Path inside datastore, either a folder or an iso.
+            name (str): Name of the VM, used as the iso filename.
+        """
+        path = path.strip('/')
+        if path.endswith('.iso'):
+            return path
+
+        return '{0}/{1}.iso'.format(path, name) if path else name + '.iso'
+
+
     @classmethod
     def create_container(cls, s_instance, *args):
         """
@@ -39,11 +77,7 @@ class Query(Logger):
             s_instance (obj): ServiceInstance
             args(list):
         """
-        if hasattr(s_instance, 'content'):
-            if hasattr(s_instance.content, 'viewManager'):
-                return s_instance.content.viewManager.CreateContainerView(*args)
-
-        return ValueError
+        return Query.service_content(s_instance).viewManager.CreateContainerView(*args)
 
 
     @classmethod
@@ -52,83 +86,236 @@ class Query(Logger):
         Returns an object inside of ContainerView if it matches name.
 
         Args:
-            container (obj):  Container object
+            container (obj):  Container object, or a dict of names and objects
+                as returned by get_inventory.
             name (str):       Name of Container
         """
 
+        if isinstance(container, dict):
+            if name in container:
+                return container[name]
+            raise ValueError('%s not found.' % (name))
+
         for obj in container:
             if obj.name == name:
                 return obj
 
         raise ValueError('%s not found.' % (name))
 
+    @staticmethod
+    def _view_filter_spec(container, prop_specs):
+        """
+        Internal method that returns a FilterSpec for prop_specs of the objects
+        inside of ContainerView.
+
+        Args:
+            container (obj):  ContainerView object
+            prop_specs (list): A list of PropertyCollector.PropertySpec objects
+        """
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+            name='traverseView', path='view', skip=False, type=vim.view.ContainerView
+        )
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(
+            obj=container, skip=True, selectSet=[traversal_spec]
+        )
+
+        return vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[obj_spec], propSet=prop_specs
+        )
+
+    @staticmethod
+    def _retrieve(s_instance, filter_spec, page_size=500):
+        """
+        Internal method that yields the ObjectContent matched by filter_spec
+        one page at a time, so the first results can be used before the whole
+        inventory has been retrieved.
+
+        Args:
+            s_instance (obj):  ServiceInstance
+            filter_spec (obj): PropertyCollector.FilterSpec
+            page_size (int):   Number of objects retrieved per call
+        """
+        collector = Query.service_content(s_instance).propertyCollector
+        result = collector.RetrievePropertiesEx(
+            [filter_spec],
+            vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+        )
+
+        while result:
+            for obj in result.objects:
+                yield obj
+
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+
+    @classmethod
+    def iter_properties(cls, s_instance, container, obj_type, path_set):
+        """
+        Yields the properties in path_set for every object of obj_type inside
+        of ContainerView as the pages arrive from vCenter.
+
+        Args:
+            s_instance (obj): ServiceInstance
+            container (obj):  ContainerView object
+            obj_type (obj):   Managed object type, i.e. vim.VirtualMachine
+            path_set (list):  Property paths, i.e. ['name', 'runtime.powerState']
+
+        Yields:
+            prop (dict): The property path as key.  The managed object itself
+                is stored under the 'obj' key.
+        """
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(
+            type=obj_type, pathSet=path_set
+        )
+        filter_spec = Query._view_filter_spec(container, [prop_spec])
+
+        for obj in Query._retrieve(s_instance, filter_spec):
+            prop = {item.name : item.val for item in obj.propSet}
+            prop.update({'obj' : obj.obj})
+            yield prop
+
+    @classmethod
+    def get_inventory(cls, s_instance, container, *obj_types):
+        """
+        Returns the names and objects inside of ContainerView for each of
+        obj_types.  The names are retrieved with the PropertyCollector instead
+        of one round-trip per object.
+
+        Args:
+            s_instance (obj): ServiceInstance
+            container (obj):  ContainerView object
+            obj_types (obj):  Managed object types, i.e. vim.VirtualMachine
+
+        Returns:
+            inventory (dict): obj_type as key and a dict of name and managed
+                object as value.
+        """
+        prop_specs = [
+            vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=['name'])
+            for obj_type in obj_types
+        ]
+        filter_spec = Query._view_filter_spec(container, prop_specs)
+
+        inventory = {obj_type : {} for obj_type in obj_types}
+        for obj in Query._retrieve(s_instance, filter_spec):
+            if not obj.propSet:
+                continue
+            for obj_type in obj_types:
+                if isinstance(obj.obj, obj_type):
+                    inventory[obj_type].update({obj.propSet[0].val : obj.obj})
+
+        return inventory
+
     @classmethod
-    def list_obj_attrs(cls, container, attr, view=True):
+    def objs_properties(cls, s_instance, objs, path_set):
         """
-        Returns a list of attributes inside of container.
+        Returns the properties in path_set of a list of managed objects, i.e.
+        the datastores of a cluster, with the PropertyCollector instead of one
+        round-trip per attribute.
+
+        Args:
+            s_instance (obj): ServiceInstance
+            objs (list):      Managed objects
+            path_set (list):  Property paths, i.e. ['name', 'summary']
+
+        Returns:
+            props (dict): Managed object as key and a dict of its properties
+                as value.
+        """
+        if not objs:
+            return {}
+
+        obj_specs = [
+            vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False) for obj in objs
+        ]
+        prop_specs = [
+            vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=path_set)
+            for obj_type in set(type(obj) for obj in objs)
+        ]
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=obj_specs, propSet=prop_specs
+        )
+
+        return {
+            obj.obj : {item.name : item.val for item in obj.propSet}
+            for obj in Query._retrieve(s_instance, filter_spec)
+        }
+
+    @staticmethod
+    def _vm_folder_tree(s_instance, datacenter_obj):
+        """
+        Internal method that returns the VM folders of a datacenter and their
+        subfolders one level deep, with one PropertyCollector call.
 
         Args:
-            container (obj):  Container object
-            attr (str):       Name of attribute within Container
-            view (bool):      True appends view attribute to Container
+            s_instance (obj):     ServiceInstance
+            datacenter_obj (obj): Datacenter object
+
+        Returns:
+            folders (list): A list of (parent name, name, folder object)
+                tuples, the parent name is None for top level folders.
         """
-        if view:
-            return [getattr(obj, attr) for obj in container.view]
+        if not hasattr(datacenter_obj, 'vmFolder'):
+            return []
 
-        return [getattr(obj, attr) for obj in container]
+        root = datacenter_obj.vmFolder
+        view = Query.create_container(s_instance, root, [vim.Folder], True)
+        props = list(
+            Query.iter_properties(s_instance, view, vim.Folder, ['name', 'parent'])
+        )
+        view.Destroy()
 
+        parents = {prop['obj']._moId : prop for prop in props}
+        folders = []
+        for prop in props:
+            parent = prop['parent']._moId
+            if parent == root._moId:
+                folders.append((None, prop['name'], prop['obj']))
+            elif parent in parents and parents[parent]['parent']._moId == root._moId:
+                folders.append((parents[parent]['name'], prop['name'], prop['obj']))
+
+        return folders
 
     @classmethod
-    def folders_lookup(cls, container, datacenter, name):
+    def folders_lookup(cls, s_instance, container, datacenter, name):
         """
         Returns the object for a folder name.  Currently, it only searches for
-        the folder through one level of subfolders. This method is needed for
-        building new virtual machines.
+        the folder through one level of subfolders, and top level folders are
+        preferred. This method is needed for building new virtual machines.
 
         Args:
-            container (obj):  Container object
+            s_instance (obj): ServiceInstance
+            container (obj):  Container object or name index
             datacenter (str): Name of datacenter
             name (str):       Name of folder
         """
+        folders = Query._vm_folder_tree(s_instance, Query.get_obj(container, datacenter))
+        matches = [folder for folder in folders if folder[1] == name]
+        for parent, dummy, folder in matches:
+            if parent is None:
+                return folder
 
-        obj = Query.get_obj(container, datacenter)
-
-        if hasattr(obj, 'vmFolder'):
-            for folder in obj.vmFolder.childEntity:
-                if hasattr(folder, 'childType'):
-                    if folder.name == name:
-                        return folder
-                if hasattr(folder, 'childEntity'):
-                    for item in folder.childEntity:
-                        if hasattr(item, 'childType'):
-                            if item.name == name:
-                                return item
-        return None
+        return matches[0][2] if matches else None
 
     @classmethod
-    def list_vm_folders(cls, container, datacenter):
+    def list_vm_folders(cls, s_instance, container, datacenter):
         """
         Returns a list of Virtual Machine folders.  Sub folders will be listed
         with its parent -> subfolder. Currently it only searches for one
         level of subfolders.
 
         Args:
-            container (obj):  Container object
+            s_instance (obj): ServiceInstance
+            container (obj):  Container object or name index
             datacenter (str): Name of datacenter
         """
-        obj = Query.get_obj(container, datacenter)
-        folders = []
-
-        if hasattr(obj, 'vmFolder'):
-            for folder in obj.vmFolder.childEntity:
-                if hasattr(folder, 'childType'):
-                    folders.append(folder.name)
-                if hasattr(folder, 'childEntity'):
-                    for item in folder.childEntity:
-                        if hasattr(item, 'childType'):
-                            folders.append(item.parent.name+' -> '+item.name)
-        return folders
-
+        return [
+            parent + ' -> ' + name if parent else name
+            for parent, name, dummy in Query._vm_folder_tree(
+                s_instance, Query.get_obj(container, datacenter)
+            )
+        ]
 
     @classmethod
     def datastore_most_space(cls, container, cluster):
@@ -159,16 +346,17 @@ class Query(Logger):
 
 
     @classmethod
-    def return_datastores(cls, container, cluster, header=True):
+    def return_datastores(cls, s_instance, container, cluster, header=True):
         """
         Returns a summary of disk space for datastores listed inside a
         cluster. Identical to list_datastore_info, but returns the datastores
         as an list object instead of printing them to stdout.
 
         Args:
-            container (obj): Container object
-            cluster (str):   Name of cluster
-            header (bool):   Enables a header of info to datastore list.
+            s_instance (obj): ServiceInstance
+            container (obj):  Container object or name index
+            cluster (str):    Name of cluster
+            header (bool):    Enables a header of info to datastore list.
         """
 
         obj = Query.get_obj(container, cluster)
@@ -176,24 +364,27 @@ class Query(Logger):
 
 
         if hasattr(obj, 'datastore'):
+            # one call for the summaries of every datastore in the cluster
+            props = Query.objs_properties(s_instance, obj.datastore, ['name', 'summary'])
             for datastore in obj.datastore:
                 info = []
+                summary = props[datastore]['summary']
                 # type is long(bytes)
-                free = int(datastore.summary.freeSpace)
-                capacity = int(datastore.summary.capacity)
+                free = int(summary.freeSpace)
+                capacity = int(summary.capacity)
 
                 # uncommitted is sometimes None, so we'll convert that to 0.
-                if not datastore.summary.uncommitted:
+                if not summary.uncommitted:
                     uncommitted = int(0)
                 else:
-                    uncommitted = int(datastore.summary.uncommitted)
+                    uncommitted = int(summary.uncommitted)
 
                 provisioned = int((capacity - free) + uncommitted)
 
                 provisioned_pct = '{0:.2%}'.format((provisioned / capacity))
                 free_pct = '{0:.2%}'.format((free / capacity))
 
-                info.append(datastore.name)
+                info.append(props[datastore]['name'])
                 info.append(Query.disk_size_format(capacity))
                 info.append(Query.disk_size_format(provisioned))
                 info.append(provisioned_pct)
@@ -222,7 +413,7 @@ class Query(Logger):
         Returns antiaffinity rules
 
         Args:
-            container (obj): Container object
+            container (obj): Container object or name index
             cluster (str):   Name of cluster
         """
 
@@ -247,26 +438,27 @@ class Query(Logger):
 
 
     @classmethod
-    def list_vm_info(cls, container, datacenter):
+    def iter_vm_info(cls, s_instance, container, datacenter):
         """
-        Returns a list of names for VMs located inside a datacenter.
+        Yields the name and moId of each VM located inside a datacenter as the
+        pages arrive from vCenter.
 
+        Args:
+            s_instance (obj): ServiceInstance
+            container (obj):  Container object or name index
+            datacenter (str): Name of datacenter
         """
-
         obj = Query.get_obj(container, datacenter)
 
-        vms = {}
-
-        # recurse through datacenter object attributes looking for vms.
         if hasattr(obj, 'vmFolder'):
-            for virtmachine in obj.vmFolder.childEntity:
-                if hasattr(virtmachine, 'childEntity'):
-                    for virt in virtmachine.childEntity:
-                        vms.update({virt.name:virt._moId})
-                else:
-                    vms.update({virtmachine.name:virt._moId})
-
-        return vms
+            view = Query.create_container(s_instance, obj.vmFolder, [vim.VirtualMachine], True)
+            try:
+                for prop in Query.iter_properties(
+                        s_instance, view, vim.VirtualMachine, ['name']
+                ):
+                    yield prop['name'], prop['obj']._moId
+            finally:
+                view.Destroy()
 
 
     @classmethod
@@ -464,7 +656,7 @@ class Query(Logger):
         Method returns a list of VM names that are associated with cluster and datastore
 
         Args:
-            container (obj): cluster container object
+            container (obj): cluster container object or name index
             cluster (str): Name of cluster to start the search
             datastore (str): Name of datastore to query
 
@@ -20,6 +20,8 @@ class VMConfig(Logger):
     def __init__(self):
         """ Define our class attributes here. """
         self.scsi_key = None
+        # keep-alive connections shared by every upload to the vCenter host
+        self.http = requests.Session()
 
     def upload_iso(self, **kwargs):
         """
@@ -64,7 +66,7 @@ class VMConfig(Logger):
 
         try:
             with open(iso, 'rb') as data:
-                response = requests.put(
+                response = self.http.put(
                     url, params=params, cookies=cookie, data=data, verify=verify
                 )
             self.logger.info('status: %s', response.status_code)
@@ -76,10 +78,11 @@ class VMConfig(Logger):
                 self.logger.error(err)
                 self.logger.error('Upload failed, retrying')
                 with open(iso, 'rb') as data:
-                    response = requests.put(
+                    response = self.http.put(
                         url, params=params, cookies=cookie, data=data, verify=verify
                     )
                 self.logger.debug(response, kwargs)
+                return response.status_code
             else:
                 self.logger.error(err, exc_info=False)
                 self.logger.error('%s %s %s %s', url, params, cookie, verify)
@@ -226,9 +229,8 @@ class VMConfig(Logger):
             else:
                 iso_path = iso_path + '/' + iso_name
 
-            # path is relative, so we strip off the first character.
-            if iso_path.startswith('/'):
-                iso_path = iso_path.lstrip('/')
+            # path is relative to the datastore, so strip any leading slashes.
+            iso_path = iso_path.lstrip('/')
 
             cdrom.device.backing = vim.vm.device.VirtualCdrom.IsoBackingInfo()
             cdrom.device.backing.fileName = '['+ datastore + '] ' + iso_path
@@ -425,12 +427,26 @@ class VMConfig(Logger):
             result (bool): Result of task_monitor
         """
 
-        self.logger.debug('%s %s', host.name, config)
-        task = host.ReconfigVM_Task(vim.vm.ConfigSpec(**config))
-        result = Tasks.task_monitor(task, True, host)
+        result = Tasks.task_monitor(self.reconfig_task(host, **config), True, host)
         return result
 
 
+    def reconfig_task(self, host, **config):
+        """
+        Method starts reconfiguring a VM without waiting for it.
+
+        Args:
+            host (obj):    VirtualMachine object
+            config (dict): A dictionary of vim.vm.ConfigSpec attributes and
+                their values.
+        Returns:
+            task (obj): ReconfigVM task
+        """
+
+        self.logger.debug('%s %s', host.name, config)
+        return host.ReconfigVM_Task(vim.vm.ConfigSpec(**config))
+
+
     def power(self, host, state):
         """
         Method manages power states.
@@ -439,22 +455,40 @@ class VMConfig(Logger):
             host (obj):  VirtualMachine object
             state (str): options are: on,off,reset,rebootshutdown
         """
+        task = self.power_task(host, state)
+        if task:
+            Tasks.task_monitor(task, True, host)
+
+
+    def power_task(self, host, state):
+        """
+        Method starts changing the power state without waiting for it.
+
+        Args:
+            host (obj):  VirtualMachine object
+            state (str): options are: on,off,reset,rebootshutdown
+        Returns:
+            task (obj): Power task, or None for reboot and shutdown, which are
+                handed to the guest and do not return a task.
+        """
         self.logger.info('%s %s', host.name, state)
         if state == 'off':
-            Tasks.task_monitor(host.PowerOff(), True, host)
+            return host.PowerOff()
 
         if state == 'on':
-            Tasks.task_monitor(host.PowerOn(), True, host)
+            return host.PowerOn()
 
         if state == 'reset':
-            Tasks.task_monitor(host.Reset(), True, host)
+            return host.Reset()
 
         if state == 'reboot':
-            Tasks.task_monitor(host.RebootGuest(), True, host)
+            host.RebootGuest()
 
         if state == 'shutdown':
             host.ShutdownGuest()
 
+        return None
+
 
     def mvfolder(self, host, folder):
         """
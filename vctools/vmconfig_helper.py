@@ -5,37 +5,156 @@
 
 import os
 import socket
+import threading
 import copy
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from pyVmomi import vim # pylint: disable=E0611
+from pyVmomi import vim, vmodl # pylint: disable=E0611
 from vctools.prompts import Prompts
 from vctools.query import Query
+from vctools.tasks import Tasks
 from vctools.vmconfig import VMConfig
 from vctools import Logger
 
 class VMConfigHelper(VMConfig, Logger):
     """Various config options for Virtual Machines."""
+    # vmconfig keys used by vctools that are not part of vim.vm.ConfigSpec
+    local_keys = frozenset(
+        ('disks', 'nics', 'folder', 'datastore', 'datacenter', 'cluster', 'switch_type')
+    )
+
     def __init__(self, auth, opts, dotrc):
         VMConfig.__init__(self)
         self.auth = auth
         self.opts = opts
         self.dotrc = dotrc
-        self.datacenters = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.Datacenter], True
-        )
-        self.clusters = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.ComputeResource], True
-        )
-        self.folders = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.Folder], True
-        )
-        self.virtual_machines = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.VirtualMachine], True
-        )
+        # a view of the VMs, created the first time it is needed.
+        self._inventory = None
+        # file that keeps the view for the next run of a kept session
+        self.view_file = None
+        # name indexes of types that do not change during a run
+        self.name_indexes = {}
+        self.name_indexes_lock = threading.Lock()
+        # folder objects by (datacenter, folder name)
+        self.folders = {}
+        # boot isos being built while the VM is created, by VM name
+        self.mkbootiso_jobs = {}
+        self.mkbootiso_pool = None
+
+    @property
+    def inventory(self):
+        """ View of the VMs. """
+        if not self._inventory and self.view_file:
+            self._inventory = self.saved_view()
+
+        if not self._inventory:
+            self._inventory = Query.create_container(
+                self.auth.session, Query.service_content(self.auth.session).rootFolder,
+                [vim.VirtualMachine], True
+            )
+            if self.view_file:
+                with open(self.view_file, 'w') as view_stream:
+                    view_stream.write(self._inventory._moId)
+
+        return self._inventory
+
+    def saved_view(self):
+        """
+        Returns the view saved by a previous run in the same session, or None
+        if there is none or the server no longer has it.
+        """
+        try:
+            with open(self.view_file) as view_stream:
+                view = vim.view.ContainerView(
+                    view_stream.read().strip(), self.auth.session._stub
+                )
+            if list(view.type) == [vim.VirtualMachine]:
+                return view
+        except (IOError, vmodl.fault.ManagedObjectNotFound):
+            pass
+
+        return None
+
+    def name_index(self, obj_type, datacenter=None):
+        """
+        Returns a cached dict of names and objects for datacenters or clusters.
+        Both indexes are built together with a single PropertyCollector
+        traversal the first time either one is needed.
+
+        Args:
+            obj_type (obj):   vim.Datacenter or vim.ComputeResource
+            datacenter (str): Name of datacenter to index the clusters of.
+                Cluster names are only unique inside of a datacenter, so
+                without one a name found in several datacenters maps to
+                only one of them.
+
+        Returns:
+            names (dict): Name as key and managed object as value.
+        """
+        # query lookups may ask for an index from several threads at once
+        with self.name_indexes_lock:
+            if obj_type not in self.name_indexes:
+                container = Query.create_container(
+                    self.auth.session, Query.service_content(self.auth.session).rootFolder,
+                    [vim.Datacenter, vim.ComputeResource], True
+                )
+                self.name_indexes.update(
+                    Query.get_inventory(
+                        self.auth.session, container, vim.Datacenter, vim.ComputeResource
+                    )
+                )
+                container.Destroy()
+
+            if not datacenter or obj_type is vim.Datacenter:
+                return self.name_indexes[obj_type]
+
+            if (obj_type, datacenter) not in self.name_indexes:
+                datacenter_obj = Query.get_obj(
+                    self.name_indexes[vim.Datacenter], datacenter
+                )
+                container = Query.create_container(
+                    self.auth.session, datacenter_obj.hostFolder, [obj_type], True
+                )
+                self.name_indexes[(obj_type, datacenter)] = Query.get_inventory(
+                    self.auth.session, container, obj_type
+                )[obj_type]
+                container.Destroy()
+
+        return self.name_indexes[(obj_type, datacenter)]
+
+    def folder_lookup(self, datacenter, name):
+        """
+        Returns the cached folder object for name inside datacenter, so that
+        specs sharing a folder only walk the folder tree once.
+
+        Args:
+            datacenter (str): Name of datacenter
+            name (str):       Name of folder
+        """
+        if (datacenter, name) not in self.folders:
+            folder = Query.folders_lookup(
+                self.auth.session, self.name_index(vim.Datacenter), datacenter, name
+            )
+            if not folder:
+                raise ValueError('%s not found.' % (name))
+            self.folders[(datacenter, name)] = folder
+
+        return self.folders[(datacenter, name)]
+
+    def destroy(self):
+        """
+        Destroy the inventory view on the server, if it was created.  A view
+        saved for the next run of a kept session is left alone.
+        """
+        if self._inventory and not self.view_file:
+            self._inventory.Destroy()
+        self._inventory = None
+        self.http.close()
+        self.name_indexes.clear()
+        self.folders.clear()
+        if self.mkbootiso_pool:
+            self.mkbootiso_pool.shutdown()
 
     def dict_merge(self, first, second):
         """
@@ -51,17 +170,68 @@ class VMConfigHelper(VMConfig, Logger):
                 second
         """
 
-        # deep copy the first to maintain it's structure
-        new = copy.deepcopy(first)
+        # only the nested dicts are copied so first keeps its structure when
+        # the result is updated, the remaining values are shared.
+        new = {
+            key : self.dict_merge(value, {}) if isinstance(value, Mapping) else value
+            for key, value in first.items()
+        }
 
         for key, value in second.items():
-            if key in new and isinstance(new[key], dict):
+            if isinstance(new.get(key, None), Mapping) and isinstance(value, Mapping):
                 new[key] = self.dict_merge(new[key], value)
             else:
-                new[key] = copy.deepcopy(value)
+                new[key] = value
 
         return new
 
+    def find_vm(self, name):
+        """
+        Returns the VirtualMachine object for name using the SearchIndex, which
+        is a single server side lookup regardless of inventory size.
+
+        Args:
+            name (str): VM name in vCenter.
+
+        Returns:
+            host (obj): VirtualMachine object or None if it was not found.
+        """
+        search_index = Query.service_content(self.auth.session).searchIndex
+        host = search_index.FindByDnsName(dnsName=name, vmSearch=True)
+
+        # the dns name belongs to the guest, so make sure it is the vm we want.
+        if host and host.name == name:
+            return host
+
+        return None
+
+    def get_vms(self, *names):
+        """
+        Returns the VirtualMachine objects that match names.  A single name
+        is looked up through the SearchIndex first, otherwise all names are
+        resolved from a single PropertyCollector call.
+
+        Args:
+            names (str): A tuple of VM names in vCenter.
+
+        Returns:
+            vms (list): A list of VirtualMachine objects in the order of names.
+        """
+        if len(names) == 1:
+            host = self.find_vm(names[0])
+            if host:
+                return [host]
+
+        vms = Query.get_inventory(
+            self.auth.session, self.inventory, vim.VirtualMachine
+        )[vim.VirtualMachine]
+
+        for name in names:
+            if name not in vms:
+                raise ValueError('%s not found.' % (name))
+
+        return [vms[name] for name in names]
+
     def create_wrapper(self, **spec):
         """
         Wrapper method for creating VMs. If certain information was
@@ -80,92 +250,125 @@ class VMConfigHelper(VMConfig, Logger):
         cluster = spec['vmconfig']['cluster']
         datastore = spec['vmconfig']['datastore']
         folder = spec['vmconfig']['folder']
+        datacenter = self.opts.datacenter or spec['vmconfig'].get('datacenter')
 
         if server_cfg.get('general', None):
             del server_cfg['general']['passwd']
 
         self.logger.info('vmconfig %s', server_cfg)
-        cluster_obj = Query.get_obj(self.clusters.view, cluster)
-
-        # list of cdrom and disk devices
-        devices = []
-
-        # add the cdrom device
-        devices.append(self.cdrom_config())
-
-        scsis = []
-        if isinstance(spec['vmconfig']['disks'], dict):
-            for scsi, disks in spec['vmconfig']['disks'].items():
-                scsis.append(self.scsi_config(scsi))
-                devices.append(scsis[scsi][1])
-                for disk in enumerate(disks):
-                    disk_cfg_opts = {}
-                    disk_cfg_opts.update(
-                        {
-                            'container' : cluster_obj.datastore,
-                            'datastore' : datastore,
-                            'size' : int(disk[1]) * (1024*1024),
-                            'controller' : scsis[scsi][0],
-                            'unit' : disk[0],
-                        }
-                    )
-                    devices.append(self.disk_config(**disk_cfg_opts))
-        else:
-            # attach up to four disks, each on its own scsi adapter
-            for scsi, disk in enumerate(spec['vmconfig']['disks']):
-                scsis.append(self.scsi_config(scsi))
-                devices.append(scsis[scsi][1])
-                disk_cfg_opts = {}
-                disk_cfg_opts.update(
-                    {
-                        'container' : cluster_obj.datastore,
-                        'datastore' : datastore,
-                        'size' : int(disk) * (1024*1024),
-                        'controller' : scsis[scsi][0],
-                        'unit' : 0,
-                    }
+        cluster_obj = Query.get_obj(
+            self.name_index(vim.ComputeResource, datacenter), cluster
+        )
+        # these do not change between the disks and nics, so fetch them once.
+        cluster_props = Query.objs_properties(
+            self.auth.session, [cluster_obj], ['datastore', 'network', 'resourcePool']
+        )[cluster_obj]
+        pool = cluster_props['resourcePool']
+        # each disk and nic looks up its datastore or network by name, so index
+        # both once instead of reading every name on each lookup.
+        names = Query.objs_properties(
+            self.auth.session,
+            list(cluster_props['datastore']) + list(cluster_props['network']),
+            ['name']
+        )
+        datastores = {
+            names[obj]['name'] : obj for obj in cluster_props['datastore'] if obj in names
+        }
+        networks = {
+            names[obj]['name'] : obj for obj in cluster_props['network'] if obj in names
+        }
+
+        # a list of disks attaches up to four disks, each on its own scsi
+        # adapter, which is the dict form with a single disk per adapter.
+        disks = spec['vmconfig']['disks']
+        if not isinstance(disks, dict):
+            disks = {scsi : [disk] for scsi, disk in enumerate(disks)}
+
+        # disk sizes are given in GB and vSphere expects KB
+        disks = {
+            scsi : [int(disk) << 20 for disk in scsi_disks]
+            for scsi, scsi_disks in disks.items()
+        }
+
+        # the cdrom device, then each scsi adapter followed by its disks
+        devices = [self.cdrom_config()]
+        for scsi, scsi_disks in disks.items():
+            controller, scsi_device = self.scsi_config(scsi)
+            devices.append(scsi_device)
+            devices.extend(
+                self.disk_config(
+                    container=datastores, datastore=datastore,
+                    size=size, controller=controller, unit=unit
                 )
-                devices.append(self.disk_config(**disk_cfg_opts))
+                for unit, size in enumerate(scsi_disks)
+            )
 
         # configure each network and add to devices
-        for nic in spec['vmconfig']['nics']:
-            nic_cfg_opts = {}
-
-            if spec['vmconfig'].get('switch_type', None) == 'distributed':
-                nic_cfg_opts.update({'switch_type' : 'distributed'})
+        nic_cfg_opts = {'container' : networks}
+        if spec['vmconfig'].get('switch_type', None) == 'distributed':
+            nic_cfg_opts['switch_type'] = 'distributed'
 
-            nic_cfg_opts.update({'container' : cluster_obj.network, 'network' : nic})
-            devices.append(self.nic_config(**nic_cfg_opts))
+        devices.extend(
+            self.nic_config(network=nic, **nic_cfg_opts) for nic in spec['vmconfig']['nics']
+        )
 
         spec['vmconfig'].update({'deviceChange':devices})
 
-        if self.opts.datacenter:
-            folder = Query.folders_lookup(
-                self.datacenters.view, self.opts.datacenter, folder
-            )
-        else:
-            folder = Query.folders_lookup(
-                self.datacenters.view, spec['vmconfig']['datacenter'], folder
-            )
+        folder = self.folder_lookup(datacenter, folder)
 
-        # delete keys that vSphere does not understand, so we can pass it a
+        # drop keys that vSphere does not understand, so we can pass it a
         # dictionary to build the VM.
-        del spec['vmconfig']['disks']
-        del spec['vmconfig']['nics']
-        del spec['vmconfig']['folder']
-        del spec['vmconfig']['datastore']
-        del spec['vmconfig']['datacenter']
-        del spec['vmconfig']['cluster']
+        vmconfig = {
+            key : value for key, value in spec['vmconfig'].items()
+            if key not in self.local_keys
+        }
 
-        if spec['vmconfig'].get('switch_type', None):
-            del spec['vmconfig']['switch_type']
+        self.logger.debug(folder, datastore, pool, devices, vmconfig)
+        self.create(folder, datastore, pool, **vmconfig)
 
-        pool = cluster_obj.resourcePool
+        return server_cfg
 
-        self.logger.debug(folder, datastore, pool, devices, spec)
-        self.create(folder, datastore, pool, **spec['vmconfig'])
 
-        return server_cfg
+    def parallel(self, func, items):
+        """
+        Calls func once for each item using a pool of threads. The work
+        for each VM or iso is mostly waiting on vCenter, so it can overlap.
+
+        Args:
+            func (function): Callable that takes a single item.
+            items (list): Items that will be passed to func.
+        Returns:
+            results (list): Result of each call in the same order as items.
+        """
+        workers = max(1, min(self.opts.parallel, len(items)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
+
+    def parallel_tasks(self, start, items):
+        """
+        Starts a vCenter task for each item and monitors them.  With
+        --parallel above 1 the tasks are started using a pool of threads, but
+        they are still monitored one at a time in this thread, so that only one
+        VM question is asked and one progress line is printed at once.
+
+        Args:
+            start (function): Callable that takes a single item, starts its
+                task and returns a tuple of the task (or None) and its VM.
+            items (list): Items that will be passed to start.
+        Returns:
+            results (list): Result of task_monitor in the same order as items,
+                or None for an item without a task.
+        """
+        if self.opts.parallel > 1:
+            started = self.parallel(start, items)
+        else:
+            # one VM at a time, each task finishes before the next one starts
+            started = (start(item) for item in items)
+
+        return [
+            Tasks.task_monitor(task, True, host) if task else None
+            for task, host in started
+        ]
 
 
     def mount_wrapper(self, datastore, path, *names):
@@ -177,30 +380,28 @@ class VMConfigHelper(VMConfig, Logger):
             path (str): Path inside datastore where the ISO is located.
             names (str): A tuple of VM names in vCenter.
         """
-        for name in names:
-            host = Query.get_obj(
-                self.virtual_machines.view, name
-            )
-
-            print('Mounting [%s] %s on %s' % (datastore, path, name))
+        def mount(item):
+            """Starts mounting the iso on a single VM."""
+            name, host, iso_path = item
+            print('Mounting [%s] %s on %s' % (datastore, iso_path, name))
             cdrom_cfg = []
             key, controller = Query.get_key(host, 'CD/DVD')
 
-            cdrom_cfg_opts = {}
-            cdrom_cfg_opts.update(
-                {
-                    'datastore' : datastore,
-                    'iso_path' : path,
-                    'iso_name' : name,
-                    'key': key,
-                    'controller' : controller,
-                }
-            )
+            cdrom_cfg_opts = {
+                'datastore' : datastore,
+                'iso_path' : iso_path,
+                'iso_name' : name,
+                'key': key,
+                'controller' : controller,
+            }
             cdrom_cfg.append(self.cdrom_config(**cdrom_cfg_opts))
 
             config = {'deviceChange' : cdrom_cfg}
             self.logger.debug(cdrom_cfg_opts, config)
-            self.reconfig(host, **config)
+            return self.reconfig_task(host, **config), host
+
+        iso_paths = [Query.iso_path(path, name) for name in names]
+        self.parallel_tasks(mount, list(zip(names, self.get_vms(*names), iso_paths)))
 
 
     def power_wrapper(self, state, *names):
@@ -211,11 +412,14 @@ class VMConfigHelper(VMConfig, Logger):
             state (str): choices: on, off, reset, reboot, shutdown
             names (str): a tuple of VM names in vCenter.
         """
-        for name in names:
-            host = Query.get_obj(self.virtual_machines.view, name)
+        def power(item):
+            """Starts changing the power state of a single VM."""
+            name, host = item
             print('%s changing power state to %s' % (name, state))
             self.logger.debug(host, state)
-            self.power(host, state)
+            return self.power_task(host, state), host
+
+        self.parallel_tasks(power, list(zip(names, self.get_vms(*names))))
 
 
     def umount_wrapper(self, *names):
@@ -225,28 +429,28 @@ class VMConfigHelper(VMConfig, Logger):
         Args:
             names (tuple): a tuple of VM names in vCenter.
         """
-        for name in names:
+        def umount(item):
+            """Starts un-mounting the iso from a single VM."""
+            name, host = item
             print('Umount ISO from %s' % (name))
-            host = Query.get_obj(self.virtual_machines.view, name)
 
             key, controller = Query.get_key(host, 'CD/DVD')
 
             self.logger.info('ISO on %s', name)
             cdrom_cfg = []
-            cdrom_cfg_opts = {}
-            cdrom_cfg_opts.update(
-                {
-                    'umount' : True,
-                    'key' : key,
-                    'controller' : controller,
-                }
-            )
+            cdrom_cfg_opts = {
+                'umount' : True,
+                'key' : key,
+                'controller' : controller,
+            }
             cdrom_cfg.append(self.cdrom_config(**cdrom_cfg_opts))
             #cdrom_cfg.append(self.cdrom_config(umount=True, key=key,
             #    controller=controller))
             config = {'deviceChange' : cdrom_cfg}
             self.logger.debug(host, config)
-            self.reconfig(host, **config)
+            return self.reconfig_task(host, **config), host
+
+        self.parallel_tasks(umount, list(zip(names, self.get_vms(*names))))
 
 
     def upload_wrapper(self, datastore, dest, verify_ssl, *isos):
@@ -257,38 +461,44 @@ class VMConfigHelper(VMConfig, Logger):
             isos (tuple): a tuple of isos locally on machine that will be
                 uploaded.  The path for each iso should be absolute.
         """
-        for iso in isos:
+        # path is relative in vsphere and the upload method adds the slashes.
+        dest = dest.strip('/')
+
+        # only the iso changes between uploads
+        base_args = {
+            'host': self.opts.host,
+            'cookie' : self.auth.session._stub.cookie,
+            'datacenter' : self.opts.datacenter,
+            'dest_folder' : dest,
+            'datastore' : datastore,
+            'verify' : verify_ssl,
+        }
+
+        def upload(iso):
+            """Uploads a single iso."""
+            iso_size = Query.disk_size_format(os.path.getsize(iso))
             print(
                 'Uploading ISO: %s, file size: %s, remote location: [%s] %s' % (
-                    iso, Query.disk_size_format(os.path.getsize(iso)), datastore, dest
+                    iso, iso_size, datastore, dest
                 )
             )
             self.logger.info(
                 'Uploading ISO: %s, file size: %s, remote location: [%s] %s',
-                iso, Query.disk_size_format(os.path.getsize(iso)), datastore, dest
-            )
-            upload_args = {}
-
-            upload_args.update(
-                {
-                    'host': self.opts.host,
-                    'cookie' : self.auth.session._stub.cookie,
-                    'datacenter' : self.opts.datacenter,
-                    'dest_folder' : dest,
-                    'datastore' : datastore,
-                    'iso' : iso,
-                    'verify' : verify_ssl,
-                }
+                iso, iso_size, datastore, dest
             )
 
+            upload_args = dict(base_args, iso=iso)
+
             result = self.upload_iso(**upload_args)
             self.logger.debug(result, upload_args)
 
-            if result == 200 or 201:
+            if result in (200, 201):
                 self.logger.info('result: %s %s uploaded successfully', result, iso)
             else:
                 self.logger.error('result: %s %s upload failed', result, iso)
 
+        self.parallel(upload, list(isos))
+
     def pre_create_hooks(self, **spec):
         """
         Additional steps for provisioning a VM prior to its creation
@@ -341,7 +551,14 @@ class VMConfigHelper(VMConfig, Logger):
             self.logger.info('mkbootiso %s', spec['mkbootiso'])
             mkbootiso_url = 'https://{0}/api/mkbootiso'.format(socket.getfqdn())
             headers = {'Content-Type' : 'application/json'}
-            requests.post(mkbootiso_url, json=spec['mkbootiso'], headers=headers, verify=False)
+            # the iso is not needed until post_create_hooks, so build it while
+            # vCenter creates the VM.
+            if not self.mkbootiso_pool:
+                self.mkbootiso_pool = ThreadPoolExecutor(max_workers=1)
+            self.mkbootiso_jobs[spec['vmconfig']['name']] = self.mkbootiso_pool.submit(
+                requests.post, mkbootiso_url, json=spec['mkbootiso'],
+                headers=headers, verify=False
+            )
 
         return spec
 
@@ -352,21 +569,25 @@ class VMConfigHelper(VMConfig, Logger):
         Returns: None
         """
 
+        upload_cfg = self.dotrc.get('upload', {})
+        mount_cfg = self.dotrc.get('mount', {})
+
+        # wait for the boot iso, upload and mount need it
+        job = self.mkbootiso_jobs.pop(spec['vmconfig']['name'], None)
+        if job:
+            response = job.result()
+            if not response.ok:
+                raise ValueError(
+                    'mkbootiso failed: %s %s' % (response.status_code, response.reason)
+                )
+
         # hooks for upload, mount, power
         if self.opts.upload:
-            datastore = self.dotrc['upload']['datastore']
-            dest = self.dotrc['upload']['dest']
+            datastore = upload_cfg['datastore']
+            dest = upload_cfg['dest']
             iso_path = '/tmp'
-            verify_ssl = bool(self.dotrc['upload']['verify_ssl'])
+            verify_ssl = bool(upload_cfg.get('verify_ssl', False))
             iso_name = spec['vmconfig']['name'] + '.iso'
-            # trailing slash is in upload method, so we strip it out
-            if dest.endswith('/'):
-                dest = dest.rstrip('/')
-
-            # path is relative (strip first character)
-            if dest.startswith('/'):
-                dest = dest.lstrip('/')
-
             if iso_path:
                 iso = iso_path + '/' + iso_name
             else:
@@ -375,20 +596,10 @@ class VMConfigHelper(VMConfig, Logger):
             self.upload_wrapper(datastore, dest, verify_ssl, iso)
 
         if self.opts.mount:
-            datastore = self.dotrc['mount']['datastore']
-            path = self.dotrc['mount']['path']
+            datastore = mount_cfg['datastore']
+            path = mount_cfg['path']
             name = spec['vmconfig']['name']
 
-            if not path.endswith('.iso'):
-                if path.endswith('/'):
-                    path = path + name + '.iso'
-                else:
-                    path = path +'/'+ name +'.iso'
-
-            # path is relative (strip first character)
-            if path.startswith('/'):
-                path = path.lstrip('/')
-
             self.mount_wrapper(datastore, path, name)
 
         if self.opts.power:
@@ -396,108 +607,112 @@ class VMConfigHelper(VMConfig, Logger):
             name = spec['vmconfig']['name']
             self.power_wrapper(state, name)
 
-    def disk_recfg(self):
-        """ Reconfigure a VM disk."""
+    def disk_recfg(self, host):
+        """
+        Reconfigure a VM disk.
+
+        Args:
+            host (obj): VirtualMachine object
+
+        Returns:
+            devices (list): Device specs to apply to the VM's deviceChange.
+        """
         devices = []
         edit = True
-        host = Query.get_obj(self.virtual_machines.view, self.opts.name)
-        disk_cfg_opts = {}
         # KB
         tokbytes = 1024*1024
         label = self.opts.disk_prefix + ' ' + str(self.opts.disk_id)
-        try:
-            key, controller = Query.get_key(host, label)
-        except IOError:
-            pass
         if self.opts.disk_id:
-            for item in host.config.hardware.device:
-                if label == item.deviceInfo.label:
-                    disk_new_size = self.opts.sizeGB * tokbytes
-                    current_size = item.capacityInKB
-                    current_size_gb = int(current_size / (1024*1024))
-                    if disk_new_size == current_size:
-                        raise ValueError(
-                            'New size and existing size are equal'.format()
-                        )
-                    if disk_new_size < current_size:
-                        raise ValueError(
-                            'Size {0} does not exceed {1}'.format(
-                                disk_new_size, current_size
-                            )
+            # fetch the device list once and index it by label
+            devices_by_label = {
+                item.deviceInfo.label : item for item in host.config.hardware.device
+            }
+            item = devices_by_label.get(label, None)
+            if item:
+                disk_new_size = self.opts.sizeGB * tokbytes
+                current_size = item.capacityInKB
+                current_size_gb = int(current_size / (1024*1024))
+                if disk_new_size == current_size:
+                    raise ValueError(
+                        'New size and existing size are equal'.format()
+                    )
+                if disk_new_size < current_size:
+                    raise ValueError(
+                        'Size {0} does not exceed {1}'.format(
+                            disk_new_size, current_size
                         )
-                    disk_delta = disk_new_size - current_size
-                    ds_capacity_kb = item.backing.datastore.summary.capacity / 1024
-                    ds_free_kb = item.backing.datastore.summary.freeSpace / 1024
-                    threshold_pct = 0.10
-                    if (ds_free_kb - disk_delta) / ds_capacity_kb < threshold_pct:
-                        raise ValueError(
-                            '{0} {1} disk space low, aborting.'.format(
-                                host.resourcePool.parent.name,
-                                item.backing.datastore.name
-                            )
+                    )
+                disk_delta = disk_new_size - current_size
+                ds_capacity_kb = item.backing.datastore.summary.capacity / 1024
+                ds_free_kb = item.backing.datastore.summary.freeSpace / 1024
+                threshold_pct = 0.10
+                if (ds_free_kb - disk_delta) / ds_capacity_kb < threshold_pct:
+                    raise ValueError(
+                        '{0} {1} disk space low, aborting.'.format(
+                            host.resourcePool.parent.name,
+                            item.backing.datastore.name
                         )
-
-                    disk_cfg_opts.update(
-                        {
-                            'size' : disk_new_size,
-                            'key' : key,
-                            'controller' : controller,
-                            'unit' : item.unitNumber,
-                            'filename' : item.backing.fileName
-                        }
                     )
-            if disk_cfg_opts:
+
+                disk_cfg_opts = {
+                    'size' : disk_new_size,
+                    'key' : item.key,
+                    'controller' : item.controllerKey,
+                    'unit' : item.unitNumber,
+                    'filename' : item.backing.fileName
+                }
                 devices.append(self.disk_config(edit=edit, **disk_cfg_opts))
                 self.logger.info(
                     '%s label: %s %s current_size: %s new_size: %s', host.name,
                     self.opts.disk_prefix, self.opts.disk_id, current_size_gb, self.opts.sizeGB
                 )
-                self.reconfig(host, **{'deviceChange': devices})
 
-    def nic_recfg(self):
-        """ Reconfigure a VM network adapter """
+        return devices
+
+    def nic_recfg(self, host):
+        """
+        Reconfigure a VM network adapter.
+
+        Args:
+            host (obj): VirtualMachine object
+
+        Returns:
+            devices (list): Device specs to apply to the VM's deviceChange.
+        """
         devices = []
         edit = True
-        host = Query.get_obj(self.virtual_machines.view, self.opts.name)
-        nic_cfg_opts = {}
         label = self.opts.nic_prefix + ' ' + str(self.opts.nic_id)
-        try:
-            key, controller = Query.get_key(host, label)
-        except IOError:
-            pass
         if self.opts.nic_id:
-            for item in host.config.hardware.device:
-                if label == item.deviceInfo.label:
-                    if self.opts.network:
-                        nic_cfg_opts.update(
-                            {
-                                'key' : key,
-                                'controller' : controller,
-                                'container' : host.runtime.host.network,
-                                'network' : self.opts.network,
-                                'mac_address': item.macAddress,
-                                'unit' : item.unitNumber,
-                            }
-                        )
-                        if self.opts.driver == 'e1000':
-                            nic_cfg_opts.update({'driver': 'VirtualE1000'})
-                        devices.append(
-                            self.nic_config(edit=edit, **nic_cfg_opts)
-                        )
-                        if devices:
-                            self.logger.info(
-                                '%s label: %s %s network: %s', host.name,
-                                self.opts.nic_prefix, self.opts.nic_id,
-                                self.opts.network
-                            )
-                            self.reconfig(host, **{'deviceChange': devices})
-
-    def folder_recfg(self):
+            # fetch the device list once and index it by label
+            devices_by_label = {
+                item.deviceInfo.label : item for item in host.config.hardware.device
+            }
+            item = devices_by_label.get(label, None)
+            if item and self.opts.network:
+                nic_cfg_opts = {
+                    'key' : item.key,
+                    'controller' : item.controllerKey,
+                    'container' : host.runtime.host.network,
+                    'network' : self.opts.network,
+                    'mac_address': item.macAddress,
+                    'unit' : item.unitNumber,
+                }
+                if self.opts.driver == 'e1000':
+                    nic_cfg_opts.update({'driver': 'VirtualE1000'})
+                devices.append(self.nic_config(edit=edit, **nic_cfg_opts))
+
+            if devices:
+                self.logger.info(
+                    '%s label: %s %s network: %s', host.name,
+                    self.opts.nic_prefix, self.opts.nic_id,
+                    self.opts.network
+                )
+
+        return devices
+
+    def folder_recfg(self, host):
         """ Move a VM to another folder """
-        host = Query.get_obj(self.virtual_machines.view, self.opts.name)
-        folder = Query.folders_lookup(
-            self.datacenters.view, self.opts.datacenter, self.opts.folder
-        )
+        folder = self.folder_lookup(self.opts.datacenter, self.opts.folder)
         self.logger.info('%s folder: %s', host.name, self.opts.folder)
         self.mvfolder(host, folder)
 
@@ -507,12 +722,11 @@ class VMConfigHelper(VMConfig, Logger):
         devices = []
         if not self.opts.network:
             # only first selection allowed for now
-            network = Prompts.networks(vm_name.summary.runtime.host)[0]
+            network = Prompts.networks(self.auth.session, vm_name.summary.runtime.host)[0]
         else:
             network = self.opts.network
-        nic_cfg_opts = {}
         esx_host_net = vm_name.summary.runtime.host.network
-        nic_cfg_opts.update({'container' : esx_host_net, 'network' : network})
+        nic_cfg_opts = {'container' : esx_host_net, 'network' : network}
         if self.opts.driver == 'e1000':
             nic_cfg_opts.update({'driver': 'VirtualE1000'})
         devices.append(self.nic_config(**nic_cfg_opts))
@@ -522,9 +736,8 @@ class VMConfigHelper(VMConfig, Logger):
             )
             self.reconfig(vm_name, **{'deviceChange': devices})
 
-    def hwupgrade_recfg(self):
+    def hwupgrade_recfg(self, host):
         """ Upgrade hardware on VM """
-        host = Query.get_obj(self.virtual_machines.view, self.opts.name)
         if self.opts.scheduled:
             self.logger.info('%s: schedule upgrade vm hardware', host.name)
         else: